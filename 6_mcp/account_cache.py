@@ -0,0 +1,126 @@
+"""
+A process-level cache of accounts for the accounts server.
+
+Reads are served from memory. Changes are held on the cached account and written behind: every
+ACCOUNT_CACHE_FLUSH_SECONDS the cache saves each dirty account once, however many changes it has
+collected, so a burst of reports costs one write. Trades are not held back; they are saved and synced
+to disk before the tool returns. If another writer saved an account first, the flush reloads it and
+re-applies the held changes (see Account.flush).
+
+Whatever is still held is saved at exit. MCP clients stop the server with SIGTERM, which skips atexit
+hooks unless the process handles it, so the server's entry point calls database.stop_on_sigterm().
+Messages go to stderr, since stdout carries the server's JSON-RPC stream.
+
+Accounts not changed here are revalidated against their stored version once they are older than
+ACCOUNT_CACHE_TTL_SECONDS, so changes from other processes such as reset.py are picked up.
+"""
+import os
+import sys
+import time
+import atexit
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from accounts import Account
+from database import read_account_version, run_async
+
+load_dotenv(override=True)
+
+ACCOUNT_CACHE_FLUSH_SECONDS = float(os.getenv("ACCOUNT_CACHE_FLUSH_SECONDS", "1.0"))
+ACCOUNT_CACHE_TTL_SECONDS = float(os.getenv("ACCOUNT_CACHE_TTL_SECONDS", "30"))
+
+
+class AccountCache:
+
+    def __init__(self, flush_interval: float = ACCOUNT_CACHE_FLUSH_SECONDS, ttl: float = ACCOUNT_CACHE_TTL_SECONDS):
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.accounts: dict[str, Account] = {}
+        self.loaded_at: dict[str, float] = {}
+        self.locks: dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self._flusher: asyncio.Task | None = None
+
+    @asynccontextmanager
+    async def account(self, name: str):
+        """
+        Use the cached account, loading it on a miss. Holds the account's lock, so that
+        concurrent tool calls and the background flush see each change whole.
+        """
+        name = name.lower()
+        self._ensure_flusher()
+        async with self.locks.setdefault(name, asyncio.Lock()):
+            yield await self._get(name)
+
+    async def _get(self, name: str) -> Account:
+        account = self.accounts.get(name)
+        if account and (account.dirty or time.monotonic() - self.loaded_at[name] < self.ttl):
+            self.hits += 1
+            return account
+        if account and await run_async(read_account_version, name) == account._version:
+            self.hits += 1
+            self.loaded_at[name] = time.monotonic()
+            return account
+        self.misses += 1
+        account = await Account.aget(name)
+        account.write_behind()
+        self.accounts[name] = account
+        self.loaded_at[name] = time.monotonic()
+        return account
+
+    def invalidate(self, name: str | None = None):
+        """ Drop one account, or every account, from the cache. Unsaved changes are discarded. """
+        names = [name.lower()] if name else list(self.accounts)
+        for key in names:
+            self.accounts.pop(key, None)
+            self.loaded_at.pop(key, None)
+
+    async def flush(self):
+        """ Save every dirty account, one write each. An account that cannot be saved is dropped and reloaded on next use. """
+        for name in list(self.accounts):
+            async with self.locks.setdefault(name, asyncio.Lock()):
+                account = self.accounts.get(name)
+                if not account or not account.dirty:
+                    continue
+                try:
+                    await account.aflush()
+                    self.flushes += 1
+                except Exception as e:
+                    print(f"Could not flush account {name}, reloading it: {e}", file=sys.stderr)
+                    self.invalidate(name)
+
+    def close(self):
+        """ Save whatever is still held, for use at exit when there is no event loop to flush from. """
+        for name, account in list(self.accounts.items()):
+            if account.dirty:
+                try:
+                    account.flush()
+                    self.flushes += 1
+                except Exception as e:
+                    print(f"Could not flush account {name} at exit: {e}", file=sys.stderr)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "accounts": len(self.accounts),
+            "dirty": sum(1 for account in self.accounts.values() if account.dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "flushes": self.flushes,
+        }
+
+
+account_cache = AccountCache()
+atexit.register(account_cache.close)
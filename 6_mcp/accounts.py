@@ -1,15 +1,47 @@
-from pydantic import BaseModel
-import json
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Literal
+import os
+import asyncio
+import random
+import time
 from dotenv import load_dotenv
 from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_price, get_share_prices
+from database import write_account, read_account, read_account_as_of, read_transactions, create_account, save_account, append_portfolio_snapshots, read_portfolio_snapshots, write_log, run_async, ConcurrentUpdateError
+from transaction_log import TransactionLog
+from codec import dumps
+from ledger import DEPOSIT, WITHDRAW, BUY, SELL, STRATEGY_CHANGE, AGGREGATES, apply_trade, recompute_aggregates
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
 
+# How many times a change is re-applied to a freshly loaded account after losing a race with another writer,
+# waiting a random time up to SAVE_BACKOFF_SECONDS, doubling with each attempt to at most SAVE_BACKOFF_MAX_SECONDS.
+# Sized so that a trade still goes through when every trader is writing the same account at once.
+MAX_SAVE_ATTEMPTS = int(os.getenv("MAX_SAVE_ATTEMPTS", "12"))
+SAVE_BACKOFF_SECONDS = float(os.getenv("SAVE_BACKOFF_SECONDS", "0.002"))
+SAVE_BACKOFF_MAX_SECONDS = float(os.getenv("SAVE_BACKOFF_MAX_SECONDS", "0.1"))
+
+# Check the running P&L aggregates against a full recomputation from the transactions on every use
+ACCOUNT_VERIFY_AGGREGATES = os.getenv("ACCOUNT_VERIFY_AGGREGATES", "").lower() in ("1", "true", "yes")
+
+# How many of the latest transactions the "recent" report view includes
+RECENT_TRANSACTIONS = 10
+
+# What report() returns: "full" is the whole account, including every transaction and time series point, read from
+# the database where the account was loaded without them;
+# "summary", the default, is the balance, strategy, holdings and totals; "recent" is the summary plus the latest
+# transactions, and is what trades confirm with
+ReportView = Literal["full", "summary", "recent"]
+REPORT_VIEWS = ("full", "summary", "recent")
+
+
+def _backoff(attempt: int) -> float:
+    """ Seconds to wait before re-applying changes after the given failed save attempt """
+    return random.uniform(0, min(SAVE_BACKOFF_MAX_SECONDS, SAVE_BACKOFF_SECONDS * 2 ** attempt))
+
 
 class Transaction(BaseModel):
     symbol: str
@@ -25,60 +57,271 @@ class Transaction(BaseModel):
         return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
 
 
+class Order(BaseModel):
+    action: Literal["buy", "sell"]
+    symbol: str
+    quantity: int
+    rationale: str = ""
+
+
 class Account(BaseModel):
     name: str
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
+    transactions: TransactionLog
     portfolio_value_time_series: list[tuple[str, float]]
+    # Running aggregates, updated with each trade (see ledger.apply_trade)
+    net_invested: float = 0.0
+    cost_basis: dict[str, float] = Field(default_factory=dict)
+    realized_pnl: float = 0.0
+
+    # How many transactions / time series points at the head of each list are already in the database
+    _saved_transactions: int = PrivateAttr(default=0)
+    _saved_time_series: int = PrivateAttr(default=0)
+    # The strategy and holdings as last stored, so a save only writes the ones that have changed
+    _stored: dict = PrivateAttr(default_factory=dict)
+    # The stored version this state was read at; saves only succeed if the account is still at it
+    _version: int = PrivateAttr(default=0)
+    _with_transactions: bool = PrivateAttr(default=True)
+    # Ledger events recorded since the last save, as (type, data, timestamp)
+    _pending_events: list = PrivateAttr(default_factory=list)
+    # Changes applied since the last save, kept so they can be re-applied if another writer got there first
+    _unsaved: list = PrivateAttr(default_factory=list)
+    _write_behind: bool = PrivateAttr(default=False)
+    _defer_trades: bool = PrivateAttr(default=False)
 
     @classmethod
-    def get(cls, name: str):
-        fields = read_account(name.lower())
+    def get(cls, name: str, transactions: bool = True, time_series: bool = False):
+        """
+        Load an account, creating it if it does not exist.
+        Callers that only need the balance, strategy or holdings can skip loading the history;
+        anything they record is still appended correctly on save. The portfolio value time series
+        is not loaded unless asked for: use timeseries.read_portfolio_series to chart it.
+        """
+        fields = read_account(name.lower(), transactions=transactions, time_series=time_series)
         if not fields:
-            fields = {
-                "name": name.lower(),
-                "balance": INITIAL_BALANCE,
-                "strategy": "",
-                "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
-            }
-            write_account(name, fields)
-        return cls(**fields)
-    
-    
-    def save(self):
-        write_account(self.name.lower(), self.model_dump())
+            create_account(name, INITIAL_BALANCE)
+            fields = read_account(name.lower(), transactions=transactions, time_series=time_series)
+        version = fields.pop("version")
+        account = cls(**fields)
+        account._version = version
+        account._with_transactions = transactions
+        account._mark_saved()
+        return account
+
+    @classmethod
+    def as_of(cls, name: str, timestamp: str):
+        """
+        Reconstruct an account as it stood at a point in time, replaying its ledger.
+
+        Args:
+            name (str): The account name
+            timestamp (str): The point in time, as YYYY-MM-DD HH:MM:SS
+
+        Returns:
+            Account: A read-only view of the account then, or None if the ledger does not reach back that far
+        """
+        fields = read_account_as_of(name, timestamp)
+        return cls(**fields) if fields else None
+
+    @classmethod
+    async def aget(cls, name: str, transactions: bool = True, time_series: bool = False):
+        """ Load an account without blocking the event loop. """
+        return await run_async(cls.get, name, transactions=transactions, time_series=time_series)
+
+
+    def save(self, durable: bool = False):
+        new_transactions = self.transactions.records(self._saved_transactions)
+        new_snapshots = self.portfolio_value_time_series[self._saved_time_series:]
+        self._version = save_account(
+            self.name, self.balance, self.strategy, self.holdings, new_transactions, new_snapshots,
+            version=self._version, events=self._pending_events, durable=durable,
+            aggregates={key: getattr(self, key) for key in AGGREGATES}, stored=self._stored or None,
+        )
+        self._pending_events = []
+        self._mark_saved()
+
+    def _mark_saved(self):
+        """ Note that everything in this account is now stored """
+        self._saved_transactions = len(self.transactions)
+        self._saved_time_series = len(self.portfolio_value_time_series)
+        self._stored = {"strategy": self.strategy, "holdings": dict(self.holdings)}
+
+    async def asave(self, durable: bool = False):
+        """ Save the account without blocking the event loop. """
+        await run_async(self.save, durable=durable)
+
+    def _reload(self):
+        """ Replace this account's state with what is stored now, discarding unsaved changes. """
+        fresh = type(self).get(self.name, transactions=self._with_transactions)
+        for field in type(self).model_fields:
+            setattr(self, field, getattr(fresh, field))
+        self._version = fresh._version
+        self._mark_saved()
+        self._pending_events = []
+
+    def _record(self, type: str, timestamp: str | None = None, **data):
+        """ Note a ledger event, to be appended on the next save """
+        timestamp = timestamp or self._now()
+        self._pending_events.append((type, data, timestamp))
+
+    @property
+    def dirty(self) -> bool:
+        """ Whether this account has changes that are not yet saved """
+        return bool(self._unsaved)
+
+    def write_behind(self, enabled: bool = True, defer_trades: bool = False):
+        """
+        Hold changes in memory until flush() instead of saving each one as it is made.
+        Trades are still saved straight away, together with anything held before them, unless defer_trades is set.
+        """
+        self._write_behind = enabled
+        self._defer_trades = defer_trades
+
+    def _now(self) -> str:
+        """ The time to stamp on transactions, events and snapshots; a backtest replaces it with a simulated clock """
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def _share_price(self, symbol: str) -> float:
+        return get_share_price(symbol)
+
+    def _share_prices(self, symbols) -> dict[str, float]:
+        return get_share_prices(symbols)
+
+    def _log(self, message: str):
+        write_log(self.name, "account", message)
+
+    def _reapply_unsaved(self) -> ValueError | None:
+        """
+        Reload the account and apply the unsaved changes again to the fresh state. A change that no longer
+        validates is dropped and its error returned; the others are kept.
+        """
+        self._reload()
+        kept, error = [], None
+        for change in self._unsaved:
+            try:
+                change()
+                kept.append(change)
+            except ValueError as e:
+                error = e
+        self._unsaved = kept
+        return error
+
+    def _apply(self, change, durable: bool = False):
+        """
+        Apply a change to this account and save it. If another writer saved the account first,
+        reload it and apply the unsaved changes again to the fresh state, so that no update is lost.
+        A change re-validates against the fresh state, so it may raise instead on a later attempt.
+        With write_behind on, changes that are not durable are only applied until the next flush.
+        """
+        change()
+        self._unsaved.append(change)
+        if not self._write_behind or (durable and not self._defer_trades):
+            self.flush(durable=durable)
+
+    async def _aapply(self, change, durable: bool = False):
+        """ As _apply, without blocking the event loop. """
+        change()
+        self._unsaved.append(change)
+        if not self._write_behind or (durable and not self._defer_trades):
+            await self.aflush(durable=durable)
+
+    def _record_value(self, portfolio_value: float):
+        """
+        Add a point to the portfolio value time series. Outside write-behind it is appended to the database
+        straight away, without the version check: a valuation cannot conflict with another writer, so it
+        never fails once a trade it follows has gone through. Held changes still go through flush, with it.
+        """
+        point = (self._now(), portfolio_value)
+        if self._write_behind or self._unsaved:
+            self._apply(lambda: self.portfolio_value_time_series.append(point))
+            return
+        self.portfolio_value_time_series.append(point)
+        append_portfolio_snapshots(self.name, [point])
+        self._saved_time_series = len(self.portfolio_value_time_series)
+
+    async def _arecord_value(self, portfolio_value: float):
+        """ As _record_value, without blocking the event loop. """
+        point = (self._now(), portfolio_value)
+        if self._write_behind or self._unsaved:
+            await self._aapply(lambda: self.portfolio_value_time_series.append(point))
+            return
+        self.portfolio_value_time_series.append(point)
+        await run_async(append_portfolio_snapshots, self.name, [point])
+        self._saved_time_series = len(self.portfolio_value_time_series)
+
+    def flush(self, durable: bool = False):
+        """ Save every change made since the last save, as one write. """
+        error = None
+        for attempt in range(MAX_SAVE_ATTEMPTS):
+            if not self._unsaved:
+                break
+            try:
+                self.save(durable=durable)
+                self._unsaved = []
+                break
+            except ConcurrentUpdateError:
+                if attempt == MAX_SAVE_ATTEMPTS - 1:
+                    raise
+                time.sleep(_backoff(attempt))
+                error = self._reapply_unsaved() or error
+        if error:
+            raise error
+
+    async def aflush(self, durable: bool = False):
+        """ As flush, without blocking the event loop. """
+        error = None
+        for attempt in range(MAX_SAVE_ATTEMPTS):
+            if not self._unsaved:
+                break
+            try:
+                await self.asave(durable=durable)
+                self._unsaved = []
+                break
+            except ConcurrentUpdateError:
+                if attempt == MAX_SAVE_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                error = await run_async(self._reapply_unsaved) or error
+        if error:
+            raise error
 
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
+        self.transactions = TransactionLog()
         self.portfolio_value_time_series = []
-        self.save()
+        self.net_invested = 0.0
+        self.cost_basis = {}
+        self.realized_pnl = 0.0
+        self._version = write_account(self.name, self.model_dump())
+        self._pending_events = []
+        self._unsaved = []
+        self._mark_saved()
 
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
-        self.balance += amount
+        def change():
+            self.balance += amount
+            self._record(DEPOSIT, amount=amount)
+        self._apply(change)
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
-        if amount > self.balance:
-            raise ValueError("Insufficient funds for withdrawal.")
-        self.balance -= amount
+        def change():
+            if amount > self.balance:
+                raise ValueError("Insufficient funds for withdrawal.")
+            self.balance -= amount
+            self._record(WITHDRAW, amount=amount)
+        self._apply(change)
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
 
-    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
-        """ Buy shares of a stock if sufficient funds are available. """
-        price = get_share_price(symbol)
+    def _buy(self, symbol: str, quantity: int, rationale: str, price: float):
         buy_price = price * (1 + SPREAD)
         total_cost = buy_price * quantity
         
@@ -87,56 +330,188 @@ class Account(BaseModel):
         elif price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
         
+        self._update_aggregates(BUY, symbol, quantity, buy_price)
         # Update holdings
         self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = self._now()
         # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
+        self.transactions.add(symbol, quantity, buy_price, timestamp, rationale)
+        self._record(BUY, timestamp, symbol=symbol, quantity=quantity, price=buy_price)
         
         # Update balance
         self.balance -= total_cost
-        self.save()
-        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
 
-    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
-        """ Sell shares of a stock if the user has enough shares. """
+    def _check_sell(self, symbol: str, quantity: int):
         if self.holdings.get(symbol, 0) < quantity:
             raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
-        
-        price = get_share_price(symbol)
+
+    def _sell(self, symbol: str, quantity: int, rationale: str, price: float):
+        self._check_sell(symbol, quantity)
         sell_price = price * (1 - SPREAD)
         total_proceeds = sell_price * quantity
         
+        self._update_aggregates(SELL, symbol, quantity, sell_price)
         # Update holdings
         self.holdings[symbol] -= quantity
         
         # If shares are completely sold, remove from holdings
         if self.holdings[symbol] == 0:
             del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = self._now()
         # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
+        self.transactions.add(symbol, -quantity, sell_price, timestamp, rationale)  # negative quantity for sell
+        self._record(SELL, timestamp, symbol=symbol, quantity=quantity, price=sell_price)
 
         # Update balance
         self.balance += total_proceeds
-        self.save()
-        write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
 
-    def calculate_portfolio_value(self):
-        """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+    def _update_aggregates(self, type: str, symbol: str, quantity: int, price: float):
+        state = {"holdings": self.holdings, **{key: getattr(self, key) for key in AGGREGATES}}
+        apply_trade(state, type, symbol, quantity, price)
+        self.net_invested = state["net_invested"]
+        self.realized_pnl = state["realized_pnl"]
+
+    def verify_aggregates(self):
+        """ Check the running aggregates against a recomputation from every transaction; raises if they disagree. """
+        transactions = (
+            self.transactions.records()
+            if self._with_transactions else read_transactions(self.name)
+        )
+        expected = recompute_aggregates(transactions)
+        symbols = set(expected["cost_basis"]) | set(self.cost_basis)
+        drift = [
+            key for key, actual, wanted in [
+                ("net_invested", self.net_invested, expected["net_invested"]),
+                ("realized_pnl", self.realized_pnl, expected["realized_pnl"]),
+                *((f"cost_basis[{s}]", self.cost_basis.get(s, 0.0), expected["cost_basis"].get(s, 0.0)) for s in symbols),
+            ]
+            if abs(actual - wanted) > 1e-6 * max(1.0, abs(wanted))
+        ]
+        if drift:
+            raise AssertionError(f"Aggregates for {self.name} disagree with its transactions: {', '.join(drift)}")
+
+    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        """ Buy shares of a stock if sufficient funds are available. """
+        price = self._share_price(symbol)
+        self._apply(lambda: self._buy(symbol, quantity, rationale, price), durable=True)
+        self._log(f"Bought {quantity} of {symbol}")
+        return self._confirm_trade()
+
+    async def abuy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        """ Buy shares of a stock without blocking the event loop. """
+        price = await asyncio.to_thread(self._share_price, symbol)
+        await self._aapply(lambda: self._buy(symbol, quantity, rationale, price), durable=True)
+        self._log(f"Bought {quantity} of {symbol}")
+        return await self._aconfirm_trade()
+
+    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        """ Sell shares of a stock if the user has enough shares. """
+        self._check_sell(symbol, quantity)
+        price = self._share_price(symbol)
+        self._apply(lambda: self._sell(symbol, quantity, rationale, price), durable=True)
+        self._log(f"Sold {quantity} of {symbol}")
+        return self._confirm_trade()
+
+    async def asell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        """ Sell shares of a stock without blocking the event loop. """
+        self._check_sell(symbol, quantity)
+        price = await asyncio.to_thread(self._share_price, symbol)
+        await self._aapply(lambda: self._sell(symbol, quantity, rationale, price), durable=True)
+        self._log(f"Sold {quantity} of {symbol}")
+        return await self._aconfirm_trade()
+
+    def _confirm_trade(self) -> str:
+        """ What a trade returns: the recent view of the account after it """
+        return "Completed. Latest details:\n" + self.report("recent")
+
+    async def _aconfirm_trade(self) -> str:
+        return "Completed. Latest details:\n" + await self.areport("recent")
+
+    def _check_batch(self, orders: list[Order], prices: dict[str, float]):
+        """ Check that a batch can be filled in full, sells first so their proceeds fund the buys """
+        holdings = dict(self.holdings)
+        balance = self.balance
+        problems = []
+        for order in sorted(orders, key=lambda order: order.action != "sell"):
+            price = prices.get(order.symbol, 0.0)
+            if order.quantity <= 0:
+                problems.append(f"{order.action} {order.symbol}: quantity must be positive")
+            elif price == 0:
+                problems.append(f"{order.action} {order.symbol}: unrecognized symbol")
+            elif order.action == "sell":
+                if holdings.get(order.symbol, 0) < order.quantity:
+                    problems.append(f"sell {order.quantity} {order.symbol}: only {holdings.get(order.symbol, 0)} held")
+                else:
+                    holdings[order.symbol] -= order.quantity
+                    balance += price * (1 - SPREAD) * order.quantity
+            else:
+                cost = price * (1 + SPREAD) * order.quantity
+                if cost > balance:
+                    problems.append(f"buy {order.quantity} {order.symbol}: insufficient funds")
+                else:
+                    holdings[order.symbol] = holdings.get(order.symbol, 0) + order.quantity
+                    balance -= cost
+        if problems:
+            raise ValueError("No orders were executed: " + "; ".join(problems))
+
+    def _execute_batch(self, orders: list[Order], prices: dict[str, float]):
+        self._check_batch(orders, prices)
+        for order in sorted(orders, key=lambda order: order.action != "sell"):
+            if order.action == "sell":
+                self._sell(order.symbol, order.quantity, order.rationale, prices[order.symbol])
+            else:
+                self._buy(order.symbol, order.quantity, order.rationale, prices[order.symbol])
+
+    def _batch_report(self, orders: list[Order], prices: dict[str, float], portfolio_value: float) -> str:
+        self._log("Executed " + ", ".join(f"{o.action} {o.quantity} {o.symbol}" for o in orders))
+        return dumps({
+            "executed": [{**order.model_dump(exclude={"rationale"}), "price": prices[order.symbol]} for order in orders],
+            "balance": self.balance,
+            "holdings": self.holdings,
+            "total_portfolio_value": portfolio_value,
+            "total_profit_loss": self.calculate_profit_loss(portfolio_value),
+        })
+
+    def execute_batch(self, orders: list[Order]) -> str:
+        """
+        Execute several orders together: every symbol is priced in one fetch, and either all the orders are
+        filled in one transaction or, if any cannot be, none are. Sells are filled before buys.
+        The portfolio value afterwards is recorded in the same transaction.
+        Returns a compact summary rather than the full account report.
+        """
+        prices = self._share_prices(self._batch_symbols(orders))
+        self._apply(self._batch_change(orders, prices), durable=True)
+        return self._batch_report(orders, prices, self.portfolio_value_time_series[-1][1])
+
+    async def aexecute_batch(self, orders: list[Order]) -> str:
+        """ Execute several orders together without blocking the event loop. """
+        prices = await asyncio.to_thread(self._share_prices, self._batch_symbols(orders))
+        await self._aapply(self._batch_change(orders, prices), durable=True)
+        return self._batch_report(orders, prices, self.portfolio_value_time_series[-1][1])
+
+    def _batch_symbols(self, orders: list[Order]) -> list[str]:
+        """ Every symbol the batch trades or the account holds, so the batch and its valuation need one fetch """
+        return list(dict.fromkeys([*(order.symbol for order in orders), *self.holdings]))
+
+    def _batch_change(self, orders: list[Order], prices: dict[str, float]):
+        """ The batch and the valuation after it, as one change, so they are saved together """
+        now = self._now()
+        def change():
+            self._execute_batch(orders, prices)
+            self.portfolio_value_time_series.append((now, self.calculate_portfolio_value(prices)))
+        return change
+
+    def calculate_portfolio_value(self, prices: dict[str, float] | None = None):
+        """ Calculate the total value of the user's portfolio, using any prices already to hand. """
+        prices = dict(prices or {})
+        prices.update(self._share_prices(symbol for symbol in self.holdings if symbol not in prices))
+        return self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        if ACCOUNT_VERIFY_AGGREGATES:
+            self.verify_aggregates()
+        return portfolio_value - self.net_invested - self.balance
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -148,30 +523,88 @@ class Account(BaseModel):
 
     def list_transactions(self):
         """ List all transactions made by the user. """
-        return [transaction.model_dump() for transaction in self.transactions]
+        return self.transactions.records()
     
-    def report(self) -> str:
-        """ Return a json string representing the account.  """
+    def report(self, view: ReportView = "summary", recent: int = RECENT_TRANSACTIONS) -> str:
+        """
+        Return a json string representing the account, and record its current value in the time series.
+
+        Args:
+            view (str): "summary", "recent" or "full" (see ReportView); "full" serializes the whole history, so is opt-in
+            recent (int): How many of the latest transactions the "recent" view includes
+        """
+        self._check_view(view)
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
+        self._record_value(portfolio_value)
+        return self._report_json(portfolio_value, view, recent)
+
+    async def areport(self, view: ReportView = "summary", recent: int = RECENT_TRANSACTIONS) -> str:
+        """ Return a json string representing the account, without blocking the event loop. """
+        self._check_view(view)
+        portfolio_value = await asyncio.to_thread(self.calculate_portfolio_value)
+        await self._arecord_value(portfolio_value)
+        if view == "full":
+            # The full view reads the stored history
+            return await run_async(self._report_json, portfolio_value, view, recent)
+        return self._report_json(portfolio_value, view, recent)
+
+    def _check_view(self, view: str):
+        if view not in REPORT_VIEWS:
+            raise ValueError(f"Unknown report view {view}; expected one of {', '.join(REPORT_VIEWS)}")
+
+    def _report_json(self, portfolio_value: float, view: ReportView = "summary", recent: int = RECENT_TRANSACTIONS) -> str:
         pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
+        if view == "full":
+            data = self.model_dump()
+            data["transactions"] = self._all_transactions()
+            data["portfolio_value_time_series"] = self._all_time_series()
+        else:
+            # Built field by field, so the transactions and time series are never serialized only to be dropped
+            data = {
+                "name": self.name,
+                "balance": self.balance,
+                "strategy": self.strategy,
+                "holdings": self.holdings,
+                "net_invested": self.net_invested,
+                "realized_pnl": self.realized_pnl,
+                "transaction_count": len(self.transactions),
+            }
+            if view == "recent":
+                data["recent_transactions"] = self.transactions.records(max(0, len(self.transactions) - recent))
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
-        write_log(self.name, "account", f"Retrieved account details")
-        return json.dumps(data)
+        self._log(f"Retrieved account details")
+        return dumps(data)
     
+    def _all_transactions(self) -> list[dict]:
+        """ Every transaction, including those stored but not loaded, then those not yet saved """
+        if self._with_transactions:
+            return self.transactions.records()
+        return read_transactions(self.name) + self.transactions.records(self._saved_transactions)
+
+    def _all_time_series(self) -> list[tuple[str, float]]:
+        """ Every portfolio value point: those stored, which are not loaded by default, then those not yet saved """
+        return [tuple(point) for point in read_portfolio_snapshots(self.name)] + self.portfolio_value_time_series[self._saved_time_series:]
+
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
-        write_log(self.name, "account", f"Retrieved strategy")
+        self._log(f"Retrieved strategy")
         return self.strategy
     
+    def _change_strategy(self, strategy: str):
+        self.strategy = strategy
+        self._record(STRATEGY_CHANGE, strategy=strategy)
+
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
-        self.strategy = strategy
-        self.save()
-        write_log(self.name, "account", f"Changed strategy")
+        self._apply(lambda: self._change_strategy(strategy))
+        self._log(f"Changed strategy")
+        return "Changed strategy"
+
+    async def achange_strategy(self, strategy: str) -> str:
+        """ Change the investment strategy without blocking the event loop. """
+        await self._aapply(lambda: self._change_strategy(strategy))
+        self._log(f"Changed strategy")
         return "Changed strategy"
 
 # Example of usage:
@@ -21,11 +21,12 @@ async def call_accounts_tool(tool_name, tool_args):
             result = await session.call_tool(tool_name, tool_args)
             return result
             
-async def read_accounts_resource(name):
+async def read_accounts_resource(name, view=None):
+    uri = f"accounts://accounts_server/{name}/{view}" if view else f"accounts://accounts_server/{name}"
     async with stdio_client(params) as streams:
         async with mcp.ClientSession(*streams) as session:
             await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
+            result = await session.read_resource(uri)
             return result.contents[0].text
         
 async def read_strategy_resource(name):
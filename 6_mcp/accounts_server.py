@@ -1,5 +1,8 @@
+import json
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from account_cache import account_cache
+from accounts import Order
+from database import stop_on_sigterm
 
 mcp = FastMCP("accounts_server")
 
@@ -10,7 +13,8 @@ async def get_balance(name: str) -> float:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).balance
+    async with account_cache.account(name) as account:
+        return account.balance
 
 @mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
@@ -19,7 +23,8 @@ async def get_holdings(name: str) -> dict[str, int]:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).holdings
+    async with account_cache.account(name) as account:
+        return dict(account.holdings)
 
 @mcp.tool()
 async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
@@ -31,7 +36,8 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
         quantity: The quantity of shares to buy
         rationale: The rationale for the purchase and fit with the account's strategy
     """
-    return Account.get(name).buy_shares(symbol, quantity, rationale)
+    async with account_cache.account(name) as account:
+        return await account.abuy_shares(symbol, quantity, rationale)
 
 
 @mcp.tool()
@@ -44,7 +50,20 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
         quantity: The quantity of shares to sell
         rationale: The rationale for the sale and fit with the account's strategy
     """
-    return Account.get(name).sell_shares(symbol, quantity, rationale)
+    async with account_cache.account(name) as account:
+        return await account.asell_shares(symbol, quantity, rationale)
+
+@mcp.tool()
+async def execute_orders(name: str, orders: list[Order]) -> str:
+    """Buy and sell several stocks in one go, for example to rebalance. All symbols are priced together;
+    sells are filled first so their proceeds can fund the buys, and if any order cannot be filled then none are.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders, each with an action ("buy" or "sell"), symbol, quantity and rationale
+    """
+    async with account_cache.account(name) as account:
+        return await account.aexecute_batch(orders)
 
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
@@ -54,17 +73,30 @@ async def change_strategy(name: str, strategy: str) -> str:
         name: The name of the account holder
         strategy: The new strategy for the account
     """
-    return Account.get(name).change_strategy(strategy)
+    async with account_cache.account(name) as account:
+        return await account.achange_strategy(strategy)
 
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.report()
+    """The account as a summary report: balance, strategy, holdings and totals, without the transaction history."""
+    async with account_cache.account(name) as account:
+        return await account.areport()
+
+@mcp.resource("accounts://accounts_server/{name}/{view}")
+async def read_account_view_resource(name: str, view: str) -> str:
+    """The account as a "full", "summary" or "recent" report; "recent" includes the latest transactions."""
+    async with account_cache.account(name) as account:
+        return await account.areport(view)
 
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.get_strategy()
+    async with account_cache.account(name) as account:
+        return account.get_strategy()
+
+@mcp.resource("accounts://cache")
+async def read_cache_stats() -> str:
+    return json.dumps(account_cache.stats())
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    stop_on_sigterm()
+    mcp.run(transport='stdio')
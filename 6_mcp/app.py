@@ -3,8 +3,16 @@ from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
+import threading
+from collections import deque
 from accounts import Account
-from database import read_log
+from database import read_log_since
+from timeseries import read_portfolio_series
+from market import get_share_prices
+from valuation import Valuation
+
+LOG_LINES = 13
+CHART_POINTS = 200
 
 mapper = {
     "trace": Color.WHITE,
@@ -16,14 +24,20 @@ mapper = {
 }
 
 class Trader:
-    def __init__(self, name: str, lastname: str, model_name: str):
+    def __init__(self, name: str, lastname: str, model_name: str, valuation: Valuation):
         self.name = name
         self.lastname = lastname
         self.model_name = model_name
-        self.account = Account.get(name)
+        self.valuation = valuation
+        self.reload()
+        self.log_cursor = 0
+        self.log_lines = deque(maxlen=LOG_LINES)
+        self.log_lock = threading.Lock()
 
     def reload(self):
         self.account = Account.get(self.name)
+        self.valuation.set_account(self.account.name, self.account.balance, self.account.holdings, self.account.net_invested)
+        self.valuation.set_prices(get_share_prices(self.account.holdings))
 
     def get_title(self) -> str:
         return f"<div style='text-align: center;font-size:34px;'>{self.name}<span style='color:#ccc;font-size:24px;'> ({self.model_name}) - {self.lastname}</span></div>"
@@ -32,7 +46,7 @@ class Trader:
         return self.account.get_strategy()
 
     def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+        df = pd.DataFrame(read_portfolio_series(self.name, max_points=CHART_POINTS), columns=["datetime", "value"])
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
     
@@ -67,23 +81,21 @@ class Trader:
     
     def get_portfolio_value(self) -> str:
         """Calculate total portfolio value based on current prices"""
-        portfolio_value = self.account.calculate_portfolio_value() or 0.0
-        pnl = self.account.calculate_profit_loss(portfolio_value) or 0.0
+        portfolio_value = self.valuation.value(self.account.name)
+        pnl = self.valuation.account_profit_loss(self.account.name)
         color = "green" if pnl >= 0 else "red"
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
     
     def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+        # The lines are shared by every browser session, so each one renders them all and compares with its own
+        with self.log_lock:
+            for id, timestamp, type, message in read_log_since(self.name, self.log_cursor, limit=LOG_LINES):
+                color = mapper.get(type, Color.WHITE).value
+                self.log_lines.append(f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>")
+                self.log_cursor = id
+            html = f"<div style='height:250px; overflow-y:auto;'>{''.join(self.log_lines)}</div>"
+        return gr.update() if html == previous else html
     
     
 class TraderView:
@@ -139,7 +151,8 @@ class TraderView:
 def create_ui():
     """Create the main Gradio UI for the trading simulation"""
     
-    traders = [Trader(trader_name, lastname, model_name) for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)]    
+    valuation = Valuation()
+    traders = [Trader(trader_name, lastname, model_name, valuation) for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)]
     trader_views = [TraderView(trader) for trader in traders]
   
     with gr.Blocks(title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True) as ui:                
@@ -0,0 +1,198 @@
+"""
+Replay accounts against historical market data, offline.
+
+A Backtest steps through the trading days of a fixture market, standing in for Polygon. On each day it
+calls a strategy for every account, which trades through the usual Account.buy_shares and sell_shares,
+then records the day's report. The accounts read time from a simulated clock and prices from the fixture
+market, and live only in memory: nothing is read from or written to the database during a run, so it
+costs little more than the arithmetic of the trades.
+
+The market can be the closing prices already stored by write_market, or a synthetic random walk.
+
+Usage: uv run backtest.py [--days 250] [--accounts 4] [--trades 25] [--symbols 50] [--seed 0] [--history]
+(--history replays the closing prices stored in ACCOUNTS_DB instead of a synthetic market)
+"""
+import time
+import random
+import argparse
+from datetime import datetime
+from typing import ClassVar
+from accounts import Account, INITIAL_BALANCE
+from fixture_market import FixtureMarket
+from transaction_log import TransactionLog
+
+MARKET_OPEN_HOUR = 9
+MARKET_CLOSE_HOUR = 16
+
+
+class SimulatedClock:
+    """ A clock that the backtest moves by hand """
+
+    def __init__(self, start: datetime):
+        self.set(start)
+
+    def set(self, moment: datetime):
+        self.current = moment
+        self._formatted = moment.strftime("%Y-%m-%d %H:%M:%S")
+
+    def now(self) -> str:
+        return self._formatted
+
+
+class SimulatedAccount(Account):
+    """
+    An Account that trades at simulated times and prices, entirely in memory: it never reads or writes
+    the database and skips the activity log and the ledger. Trades and reports go through the usual
+    Account methods; only the hooks they call are replaced, and a trade confirms with one line rather
+    than a report.
+
+    The clock and market are shared by every account in a run, so they are bound to a subclass with
+    bind() rather than kept per instance; class attributes are also much cheaper to read on a hot path
+    than pydantic private attributes.
+    """
+    clock: ClassVar[SimulatedClock | None] = None
+    market: ClassVar[FixtureMarket | None] = None
+
+    @classmethod
+    def bind(cls, clock: SimulatedClock, market: FixtureMarket) -> type["SimulatedAccount"]:
+        """ A subclass whose accounts use this clock and market """
+        return type(cls.__name__, (cls,), {"clock": clock, "market": market, "__module__": cls.__module__})
+
+    @classmethod
+    def open(cls, name: str, balance: float = INITIAL_BALANCE) -> "SimulatedAccount":
+        return cls(
+            name=name.lower(), balance=balance, strategy="", holdings={},
+            transactions=TransactionLog(), portfolio_value_time_series=[],
+        )
+
+    def _now(self) -> str:
+        return self.clock.now()
+
+    def _share_price(self, symbol: str) -> float:
+        return self.market.get_share_price(symbol)
+
+    def _share_prices(self, symbols) -> dict[str, float]:
+        return self.market.get_share_prices(symbols)
+
+    def _log(self, message: str):
+        pass
+
+    def _record(self, type: str, timestamp: str | None = None, **data):
+        pass
+
+    def _all_transactions(self) -> list[dict]:
+        return self.transactions.records()
+
+    def _all_time_series(self) -> list[tuple[str, float]]:
+        return self.portfolio_value_time_series
+
+    def _apply(self, change, durable: bool = False):
+        change()
+
+    def _confirm_trade(self) -> str:
+        # The strategy reads the account directly; a report per trade would only be thrown away
+        return "Completed."
+
+    def _record_value(self, portfolio_value: float):
+        """ Keep one portfolio value per simulated moment: the clock only moves between days """
+        now = self._now()
+        series = self.portfolio_value_time_series
+        if series and series[-1][0] == now:
+            series[-1] = (now, portfolio_value)
+        else:
+            series.append((now, portfolio_value))
+
+
+def random_strategy(trades: int = 25, seed: int = 0):
+    """ A strategy that makes random buys and sells, for exercising the engine """
+    rng = random.Random(seed)
+
+    def strategy(account: SimulatedAccount, date: str, prices: dict[str, float]):
+        symbols = list(prices)
+        for _ in range(trades):
+            try:
+                if account.holdings and rng.random() < 0.4:
+                    symbol = rng.choice(list(account.holdings))
+                    account.sell_shares(symbol, rng.randint(1, account.holdings[symbol]), "backtest")
+                else:
+                    symbol = rng.choice(symbols)
+                    account.buy_shares(symbol, rng.randint(1, 10), "backtest")
+            except ValueError:
+                pass
+
+    return strategy
+
+
+class Backtest:
+
+    def __init__(self, market: FixtureMarket, strategy, names: list[str]):
+        """
+        Args:
+            market (FixtureMarket): The prices to replay
+            strategy: Called as strategy(account, date, prices) for each account on each day
+            names (list): The accounts to simulate
+        """
+        self.market = market
+        self.strategy = strategy
+        self.names = names
+
+    def run(self) -> dict:
+        """
+        Run the strategy over every day of the market. Nothing is read from or written to the database.
+
+        Returns:
+            dict: Days, trades, elapsed seconds, trades per second, and each account's final position
+        """
+        first = datetime.strptime(self.market.dates[0], "%Y-%m-%d")
+        clock = SimulatedClock(first.replace(hour=MARKET_OPEN_HOUR))
+        account_type = SimulatedAccount.bind(clock, self.market)
+        accounts = [account_type.open(name) for name in self.names]
+        trades = 0
+        started = time.perf_counter()
+        for date in self.market.dates:
+            self.market.set_date(date)
+            clock.set(datetime.strptime(date, "%Y-%m-%d").replace(hour=MARKET_CLOSE_HOUR))
+            prices = self.market.closes[date]
+            for account in accounts:
+                before = len(account.transactions)
+                self.strategy(account, date, prices)
+                trades += len(account.transactions) - before
+                account.report()
+        elapsed = time.perf_counter() - started
+        results = {}
+        for account in accounts:
+            value = account.calculate_portfolio_value()
+            results[account.name] = {
+                "value": value,
+                "profit_loss": account.calculate_profit_loss(value),
+                "realized_pnl": account.realized_pnl,
+                "holdings": dict(account.holdings),
+            }
+        return {
+            "days": len(self.market.dates),
+            "trades": trades,
+            "seconds": elapsed,
+            "trades_per_second": trades / elapsed if elapsed else 0.0,
+            "accounts": results,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay accounts against historical prices")
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--trades", type=int, default=25, help="trades per account per day")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", action="store_true", help="replay the closing prices stored in ACCOUNTS_DB")
+    args = parser.parse_args()
+    if args.history:
+        market = FixtureMarket.from_database()
+    else:
+        market = FixtureMarket.synthetic(args.symbols, args.days, args.seed)
+    names = [f"backtest{i}" for i in range(args.accounts)]
+    result = Backtest(market, random_strategy(args.trades, args.seed), names).run()
+    print(f"{result['trades']:,} trades over {result['days']} days in {result['seconds']:.2f}s "
+          f"({result['trades_per_second']:,.0f} trades/s)")
+    for name, account in result["accounts"].items():
+        print(f"  {name}: value ${account['value']:,.2f}, P&L ${account['profit_loss']:,.2f}")
@@ -0,0 +1,10 @@
+"""
+Benchmarks for the 6_mcp stack, each run as a module from the 6_mcp directory: uv run -m benchmarks.<name>
+
+The project modules load .env with override=True, which would let a developer's settings replace the
+temporary database and settings a benchmark sets up, pointing it at their own data or a live Polygon
+plan. Importing this package first keeps them from loading .env at all.
+"""
+import dotenv
+
+dotenv.load_dotenv = lambda *args, **kwargs: False
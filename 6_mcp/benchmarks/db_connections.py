@@ -0,0 +1,75 @@
+"""
+Micro-benchmark: connection-per-call sqlite (the original database.py) vs the pooled WAL connections.
+
+Run from the 6_mcp directory with: uv run -m benchmarks.db_connections
+"""
+import os
+import sqlite3
+import json
+import tempfile
+import time
+
+tmp = tempfile.mkdtemp()
+os.environ["ACCOUNTS_DB"] = os.path.join(tmp, "pooled.db")
+
+import database  # noqa: E402
+
+ACCOUNT = {
+    "name": "bench",
+    "balance": 10_000.0,
+    "strategy": "Buy low, sell high",
+    "holdings": {"AAPL": 10, "MSFT": 5},
+    "transactions": [],
+    "portfolio_value_time_series": [],
+}
+
+
+class PerCallDatabase:
+    """ The original helpers, opening a fresh connection and committing on every call """
+
+    def __init__(self, path):
+        self.path = path
+        with sqlite3.connect(path) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, datetime DATETIME, type TEXT, message TEXT)')
+
+    def write_account(self, name, account_dict):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('INSERT INTO accounts (name, account) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET account=excluded.account', (name, json.dumps(account_dict)))
+            conn.commit()
+
+    def read_account(self, name):
+        with sqlite3.connect(self.path) as conn:
+            row = conn.execute('SELECT account FROM accounts WHERE name = ?', (name,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def write_log(self, name, type, message):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)", (name, type, message))
+            conn.commit()
+
+
+def ops_per_second(fn, n) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - start)
+
+
+def run(n: int = 2000) -> dict[str, dict[str, float]]:
+    before = PerCallDatabase(os.path.join(tmp, "per_call.db"))
+    scenarios = {
+        "write_account": (lambda: before.write_account("bench", ACCOUNT), lambda: database.write_account("bench", ACCOUNT)),
+        "read_account": (lambda: before.read_account("bench"), lambda: database.read_account("bench")),
+        "write_log": (lambda: before.write_log("bench", "account", "Retrieved account details"), lambda: database.write_log("bench", "account", "Retrieved account details")),
+    }
+    results = {}
+    for name, (old, new) in scenarios.items():
+        results[name] = {"before": ops_per_second(old, n), "after": ops_per_second(new, n)}
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        speedup = result["after"] / result["before"]
+        print(f"{name:>15}: {result['before']:>10,.0f} ops/s -> {result['after']:>10,.0f} ops/s ({speedup:.1f}x)")
@@ -0,0 +1,48 @@
+"""
+Latency seen by write_log callers while several threads log concurrently, and how long the backlog takes to land.
+
+Run from the 6_mcp directory with: uv run -m benchmarks.log_writer
+"""
+import os
+import tempfile
+import threading
+import time
+
+os.environ["ACCOUNTS_DB"] = os.path.join(tempfile.mkdtemp(), "logs.db")
+
+import database  # noqa: E402
+
+
+def run(threads: int = 4, per_thread: int = 5000) -> dict[str, float]:
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index: int):
+        mine = []
+        for i in range(per_thread):
+            start = time.perf_counter()
+            database.write_log(f"trader{index}", "function", f"Started function {i}")
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    database.flush()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "entries": len(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "entries_per_second": len(latencies) / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    for key, value in run().items():
+        print(f"{key:>20}: {value:,.3f}")
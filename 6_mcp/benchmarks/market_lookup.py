@@ -0,0 +1,85 @@
+"""
+Cold-start price lookups: a fresh process answering one get_share_price from the stored EOD snapshot.
+
+"before" decodes the whole day's JSON blob, as the original market table required;
+"after" does a point lookup in market_prices.
+
+Run from the 6_mcp directory with: uv run -m benchmarks.market_lookup
+"""
+import json
+import os
+import random
+import sqlite3
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+DATE = "2025-01-02"
+SYMBOLS = 10_000
+
+# Both processes pay for their imports and schema setup before the clock starts (the original
+# database module created its tables at import too); the clock covers answering the first lookup
+BEFORE = """
+import sqlite3, json, time, sys, benchmarks
+start = time.perf_counter()
+conn = sqlite3.connect(sys.argv[1])
+data = json.loads(conn.execute('SELECT data FROM market WHERE date = ?', (sys.argv[2],)).fetchone()[0])
+price = data.get(sys.argv[3], 0.0)
+print(time.perf_counter() - start)
+"""
+
+AFTER = """
+import sqlite3, json, time, sys, benchmarks
+import database
+start = time.perf_counter()
+price = database.read_market_price(sys.argv[2], sys.argv[3]) or 0.0
+print(time.perf_counter() - start)
+"""
+
+
+def make_snapshot() -> dict[str, float]:
+    rng = random.Random(42)
+    symbols = {"".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5))) for _ in range(SYMBOLS * 2)}
+    return {symbol: round(rng.uniform(1, 500), 2) for symbol in sorted(symbols)[:SYMBOLS]}
+
+
+def cold_lookup(script: str, db: str, symbol: str, env: dict) -> tuple[float, float]:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", script, db, DATE, symbol], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1]), time.perf_counter() - start
+
+
+def run(repeats: int = 10) -> dict[str, dict[str, float]]:
+    tmp = tempfile.mkdtemp()
+    snapshot = make_snapshot()
+    symbol = list(snapshot)[len(snapshot) // 2]
+
+    legacy = os.path.join(tmp, "legacy.db")
+    with sqlite3.connect(legacy) as conn:
+        conn.execute("CREATE TABLE market (date TEXT PRIMARY KEY, data TEXT)")
+        conn.execute("INSERT INTO market VALUES (?, ?)", (DATE, json.dumps(snapshot)))
+
+    columnar = os.path.join(tmp, "columnar.db")
+    env = {**os.environ, "ACCOUNTS_DB": columnar, "PYTHONPATH": os.getcwd()}
+    subprocess.run(
+        [sys.executable, "-c", "import sys, json, benchmarks, database; database.write_market(sys.argv[1], json.loads(sys.stdin.read()))", DATE],
+        input=json.dumps(snapshot), env=env, text=True, check=True,
+    )
+
+    results = {}
+    for label, script, db in [("before", BEFORE, legacy), ("after", AFTER, columnar)]:
+        timings = [cold_lookup(script, db, symbol, env) for _ in range(repeats)]
+        results[label] = {
+            "lookup_ms": 1000 * sorted(t[0] for t in timings)[repeats // 2],
+            "process_ms": 1000 * sorted(t[1] for t in timings)[repeats // 2],
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for label, result in run().items():
+        print(f"{label:>7}: first lookup {result['lookup_ms']:8.2f} ms, whole process {result['process_ms']:8.2f} ms")
@@ -0,0 +1,290 @@
+"""
+Repeatable benchmarks for the accounts, database and market stack, with machine-readable results.
+
+Every scenario runs against a fresh temporary database, with a fake price source, so results depend only
+on the code. Results are written as JSON, tagged with the git commit, so two runs can be compared:
+
+    uv run -m benchmarks.suite --output before.json
+    (change something)
+    uv run -m benchmarks.suite --output after.json --compare before.json
+
+Run from the 6_mcp directory. --quick caps the largest account at 10k transactions for a fast check.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+
+tmp = tempfile.mkdtemp()
+SUITE_DB = os.path.join(tmp, "suite.db")
+os.environ["ACCOUNTS_DB"] = SUITE_DB
+# get_share_price only reads the stored EOD map when it believes Polygon is configured; nothing is fetched
+os.environ["POLYGON_API_KEY"] = "benchmark"
+os.environ["POLYGON_PLAN"] = ""
+
+import codec  # noqa: E402
+import database  # noqa: E402
+import market  # noqa: E402
+from accounts import Account  # noqa: E402
+from backtest import Backtest, random_strategy  # noqa: E402
+from fixture_market import FixtureMarket  # noqa: E402
+
+SYMBOLS = [f"S{i:03d}" for i in range(500)]
+FAKE_PRICES = {symbol: 10.0 + i for i, symbol in enumerate(SYMBOLS)}
+TRANSACTION_COUNTS = (10, 1_000, 100_000)
+LOG_ENTRIES = 200_000
+LOG_TRADERS = 4
+# The backtest should replay tens of thousands of trades a second
+BACKTEST_DAYS = 100
+BACKTEST_ACCOUNTS = 4
+BACKTEST_TRADES = 50
+
+
+def _offline(*args, **kwargs):
+    raise RuntimeError("The benchmark suite must not call Polygon")
+
+
+async def _aoffline(*args, **kwargs):
+    _offline()
+
+
+# .env is not loaded (see benchmarks/__init__.py), but in case it was before this module, set what the modules read directly too, and take away
+# every call that would reach Polygon
+database.use_database(SUITE_DB)
+market.polygon_api_key = "benchmark"
+market.is_paid_polygon = market.is_realtime_polygon = False
+market.polygon_client = market.get_all_share_prices_polygon_eod = market.get_share_prices_polygon_min = _offline
+market.apolygon_get = market.aget_share_prices_polygon_min = _aoffline
+market.price_cache = market.PriceCache(_offline, _aoffline)
+assert database.DB == SUITE_DB, f"The benchmark suite would write to {database.DB}"
+assert not (market.is_paid_polygon or market.is_realtime_polygon), "The benchmark suite found a live Polygon plan configured"
+
+
+class BenchmarkAccount(Account):
+    """ An Account priced from a fixed table instead of the market """
+
+    def _share_price(self, symbol: str) -> float:
+        return FAKE_PRICES.get(symbol, 0.0)
+
+    def _share_prices(self, symbols) -> dict[str, float]:
+        return {symbol: FAKE_PRICES.get(symbol, 0.0) for symbol in symbols}
+
+
+def measure(fn, n: int, warmup: int = 1) -> dict[str, float]:
+    """ Time n calls of fn after some warmup calls, returning latency percentiles in milliseconds """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    total = sum(times)
+    return {
+        "n": n,
+        "mean_ms": total / n * 1000,
+        "p50_ms": times[n // 2] * 1000,
+        "p99_ms": times[min(n - 1, int(n * 0.99))] * 1000,
+        "ops_per_sec": n / total if total else 0.0,
+    }
+
+
+def seed_account(name: str, transactions: int) -> None:
+    """ Store an account with the given number of past transactions, all in one write """
+    start = datetime(2024, 1, 1, 9, 30)
+    rows = [
+        {
+            "symbol": SYMBOLS[i % len(SYMBOLS)],
+            "quantity": 1,
+            "price": FAKE_PRICES[SYMBOLS[i % len(SYMBOLS)]],
+            "timestamp": (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            "rationale": "Seeded by the benchmark suite to give the account some history",
+        }
+        for i in range(transactions)
+    ]
+    holdings = {}
+    for row in rows:
+        holdings[row["symbol"]] = holdings.get(row["symbol"], 0) + 1
+    database.write_account(name, {
+        "balance": 1e12,
+        "strategy": "Benchmark",
+        "holdings": holdings,
+        "transactions": rows,
+        "portfolio_value_time_series": [],
+        "net_invested": sum(row["price"] for row in rows),
+    })
+
+
+def bench_round_trip() -> dict:
+    seed_account("roundtrip", 10)
+
+    def round_trip():
+        account = BenchmarkAccount.get("roundtrip")
+        account.change_strategy("Benchmark")
+
+    return {"account_get_save": measure(round_trip, 500, warmup=20)}
+
+
+def bench_trading(sizes) -> dict:
+    results = {}
+    for count in sizes:
+        name = f"history{count}"
+        seed_account(name, count)
+        account = BenchmarkAccount.get(name)
+        n = 200 if count <= 1_000 else 10
+        results[f"account_get_{count}"] = measure(lambda: BenchmarkAccount.get(name), max(3, n // 4))
+        results[f"buy_shares_{count}"] = measure(lambda: account.buy_shares("S001", 1, "Benchmark trade"), n)
+        for view in ("full", "summary", "recent"):
+            key = f"report_{count}" if view == "full" else f"report_{view}_{count}"
+            report = account.report(view)
+            results[key] = {**measure(lambda: account.report(view), n), "bytes": len(report.encode())}
+    return results
+
+
+def codecs() -> dict:
+    """ (encode, decode) for every available format: the standard library, orjson and msgpack """
+    available = {"json": (json.dumps, json.loads)}
+    if codec.orjson is not None:
+        available["orjson"] = (codec.orjson.dumps, codec.orjson.loads)
+    if codec.msgpack is not None:
+        available["msgpack"] = (codec.msgpack.packb, codec.msgpack.unpackb)
+    return available
+
+
+def bench_codec(count: int) -> dict:
+    """
+    Encode and decode a large account in each format: the whole account as report() dumps it, a ledger
+    snapshot holding every symbol, and the ledger events for all of its trades, whose total is what they
+    take up on disk.
+    """
+    account = BenchmarkAccount.get(f"history{count}")
+    payloads = {
+        "account": account.model_dump(),
+        "snapshot": {
+            "balance": account.balance,
+            "strategy": account.strategy,
+            "holdings": {symbol: 1 for symbol in SYMBOLS},
+            "net_invested": account.net_invested,
+            "cost_basis": {symbol: FAKE_PRICES[symbol] for symbol in SYMBOLS},
+            "realized_pnl": account.realized_pnl,
+        },
+    }
+    events = [{"symbol": t["symbol"], "quantity": t["quantity"], "price": t["price"]} for t in account.transactions.records()]
+    results = {}
+    for format, (encode, decode) in codecs().items():
+        for kind, payload in payloads.items():
+            encoded = encode(payload)
+            n = 10 if kind == "account" else 1000
+            results[f"codec_{kind}_{format}_encode"] = {**measure(lambda: encode(payload), n), "bytes": len(encoded)}
+            results[f"codec_{kind}_{format}_decode"] = measure(lambda: decode(encoded), n)
+        encoded = [encode(event) for event in events]
+        results[f"codec_events_{format}_encode"] = {
+            **measure(lambda: [encode(event) for event in events], 5),
+            "bytes": sum(len(event) for event in encoded),
+        }
+        results[f"codec_events_{format}_decode"] = measure(lambda: [decode(event) for event in encoded], 5)
+    return results
+
+
+def bench_logs() -> dict:
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with database.transaction() as conn:
+        conn.executemany(database.INSERT_LOG, (
+            (f"trader{i % LOG_TRADERS}", now, "function", f"Called tool {i}") for i in range(LOG_ENTRIES)
+        ))
+    last_id = database.connect().execute("SELECT MAX(id) FROM logs").fetchone()[0]
+    return {
+        "read_log": measure(lambda: list(database.read_log("trader1", 13)), 1000, warmup=20),
+        "read_log_since": measure(lambda: database.read_log_since("trader1", last_id - 50), 1000, warmup=20),
+    }
+
+
+def bench_prices() -> dict:
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    database.write_market(today, FAKE_PRICES)
+    market.ensure_market_for_prior_date(today)
+    cache = market.PriceCache(lambda symbols: {symbol: FAKE_PRICES[symbol] for symbol in symbols}, ttl=3600)
+    return {
+        "get_share_price_hit": measure(lambda: market.get_share_price("S250"), 5000, warmup=50),
+        "get_share_price_miss": measure(lambda: market.get_share_price("NOPE"), 5000, warmup=50),
+        "get_share_prices_50": measure(lambda: market.get_share_prices(SYMBOLS[:50]), 1000, warmup=20),
+        "price_cache_hit_50": measure(lambda: cache.get_many(SYMBOLS[:50]), 1000, warmup=20),
+    }
+
+
+def bench_backtest() -> dict:
+    market = FixtureMarket.synthetic(50, BACKTEST_DAYS)
+    names = [f"backtest{i}" for i in range(BACKTEST_ACCOUNTS)]
+    runs = []
+
+    def run_backtest():
+        runs.append(Backtest(market, random_strategy(BACKTEST_TRADES), names).run())
+
+    result = measure(run_backtest, 5)
+    trades, seconds = runs[-1]["trades"], sorted(run["seconds"] for run in runs)[len(runs) // 2]
+    return {"backtest": {**result, "trades": trades, "trades_per_second": trades / seconds if seconds else 0.0}}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick: bool = False) -> dict:
+    sizes = tuple(min(count, 10_000) for count in TRANSACTION_COUNTS) if quick else TRANSACTION_COUNTS
+    scenarios = {}
+    scenarios.update(bench_round_trip())
+    scenarios.update(bench_trading(sizes))
+    scenarios.update(bench_codec(sizes[-1]))
+    scenarios.update(bench_logs())
+    scenarios.update(bench_prices())
+    scenarios.update(bench_backtest())
+    database.flush()
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "scenarios": scenarios,
+    }
+
+
+def compare(before: dict, after: dict) -> list[str]:
+    """ One line per scenario in both runs, with the change in mean latency """
+    lines = []
+    for name, result in after["scenarios"].items():
+        previous = before["scenarios"].get(name)
+        if not previous:
+            continue
+        ratio = result["mean_ms"] / previous["mean_ms"] if previous["mean_ms"] else float("inf")
+        lines.append(f"{name:>24}: {previous['mean_ms']:>10.3f} ms -> {result['mean_ms']:>10.3f} ms ({ratio:.2f}x)")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the accounts, database and market stack")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a previous results file to compare against")
+    parser.add_argument("--quick", action="store_true", help="cap account histories at 10k transactions")
+    args = parser.parse_args()
+    results = run(quick=args.quick)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), results)))
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,85 @@
+"""
+Encoding for the payloads the database stores as blobs (ledger events and snapshots) and for the JSON
+the servers return.
+
+Each stored payload carries the id of the format it was written in, so rows stay readable when the
+format changes. ACCOUNTS_CODEC picks the format for new rows:
+
+    json     (the default) JSON text, encoded with orjson when it is installed and the standard library otherwise
+    msgpack  MessagePack, a compact binary format; needs the msgpack package
+
+Both packages come with the project's "codec" extra: uv sync --extra codec
+
+Rows written before formats were recorded are JSON, format 0.
+"""
+import os
+import json
+from typing import Any
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+load_dotenv(override=True)
+
+JSON = 0
+MSGPACK = 1
+
+FORMATS = {"json": JSON, "msgpack": MSGPACK}
+
+
+def dumps(value: Any) -> str:
+    """ JSON text, using orjson if it is available """
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def loads(text: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _format(name: str) -> int:
+    if name not in FORMATS:
+        raise ValueError(f"Unknown codec {name}; expected one of {', '.join(FORMATS)}")
+    if FORMATS[name] == MSGPACK and msgpack is None:
+        raise ImportError("The msgpack codec needs the msgpack package: uv sync --extra codec")
+    return FORMATS[name]
+
+
+ACCOUNTS_CODEC = _format(os.getenv("ACCOUNTS_CODEC", "json").lower())
+
+
+def encode(value: Any, format: int | None = None) -> tuple[int, str | bytes]:
+    """
+    Encode a payload for storage.
+
+    Args:
+        value: A dict, list or scalar, as would go into JSON
+        format (int): JSON or MSGPACK; ACCOUNTS_CODEC if None
+
+    Returns:
+        tuple: (format, payload), to be stored side by side
+    """
+    format = ACCOUNTS_CODEC if format is None else format
+    if format == MSGPACK:
+        return MSGPACK, msgpack.packb(value)
+    return JSON, dumps(value)
+
+
+def decode(format: int, payload: str | bytes) -> Any:
+    """ Decode a stored payload written in the given format """
+    if format == MSGPACK:
+        if msgpack is None:
+            raise ImportError("This row was written with the msgpack codec, which needs the msgpack package")
+        return msgpack.unpackb(payload)
+    return loads(payload)
@@ -1,101 +1,985 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import sys
+import signal
+import threading
+import queue
+import time
+import atexit
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from ledger import OPEN, RESET, AGGREGATES, empty_state, replay, recompute_aggregates
+from codec import encode, decode
 
 load_dotenv(override=True)
 
-DB = "accounts.db"
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
 
+# Connections are long-lived and reused, so these are paid once per thread rather than per call
+PRAGMAS = {
+    "busy_timeout": 5000,
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            datetime DATETIME,
-            type TEXT,
-            message TEXT
-        )
-    ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
+# write_log hands entries to a background thread, which inserts them in batches of up to
+# LOG_FLUSH_ROWS rows, or whatever has arrived after LOG_FLUSH_SECONDS
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_ROWS = int(os.getenv("LOG_FLUSH_ROWS", "500"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "0.25"))
+
+# Each account's state is snapshotted every this many ledger events, so loading it replays at most that many
+ACCOUNT_SNAPSHOT_EVERY = int(os.getenv("ACCOUNT_SNAPSHOT_EVERY", "50"))
+
+# Async callers run their database work on this many threads, each with its own pooled connection
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+
+# sqlite3 keeps an LRU of compiled statements per connection; keep it large enough for every query below
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_lock = threading.Lock()
+_connections: list[sqlite3.Connection] = []
+_generation = 0
+
+
+def _open(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        uri=path.startswith("file:"),
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+    with _lock:
+        _connections.append(conn)
+    return conn
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Return the connection for the current thread, opening it on first use.
+
+    Connections are cached per thread and per process, so a forked child never reuses its parent's handle.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid() or _local.generation != _generation:
+        conn = _open(DB)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.generation = _generation
+        _local.depth = 0
+    return conn
+
+
+@contextmanager
+def transaction(immediate: bool = False, durable: bool = False):
+    """
+    Run the enclosed statements in a single transaction on the pooled connection.
+
+    Nested calls join the outermost transaction, which commits on exit or rolls back on error.
+
+    Args:
+        immediate (bool): Take the write lock up front, for read-then-write sequences
+        durable (bool): Sync the commit to disk before returning, rather than at the next checkpoint
+    """
+    conn = connect()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+    if durable:
+        conn.execute("PRAGMA synchronous=FULL")
+    try:
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        _local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            _local.depth = 0
+            conn.rollback()
+            raise
+        _local.depth = 0
         conn.commit()
+    finally:
+        if durable:
+            conn.execute(f"PRAGMA synchronous={PRAGMAS['synchronous']}")
+
+
+def close_all():
+    """ Close every pooled connection; the next call on any thread reopens one. """
+    global _generation
+    with _lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="database")
+
+
+async def run_async(fn, *args, **kwargs):
+    """
+    Await a blocking database call without stalling the event loop.
+
+    The call runs on one of DB_THREADS worker threads; each keeps its own pooled connection,
+    so under WAL concurrent reads from several coroutines proceed in parallel.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+INSERT_ACCOUNT = '''
+    INSERT INTO accounts (name, balance, strategy, net_invested)
+    VALUES (?, ?, ?, COALESCE(?, 0.0))
+    ON CONFLICT(name) DO UPDATE SET
+        balance=excluded.balance, strategy=excluded.strategy, net_invested=excluded.net_invested, version=accounts.version + 1
+'''
+# net_invested is left as it is when given as NULL
+UPDATE_ACCOUNT = '''
+    UPDATE accounts SET balance = ?, strategy = ?, net_invested = COALESCE(?, net_invested), version = version + 1
+    WHERE name = ? AND version = ?
+'''
+UPDATE_ACCOUNT_BALANCE = '''
+    UPDATE accounts SET balance = ?, net_invested = COALESCE(?, net_invested), version = version + 1
+    WHERE name = ? AND version = ?
+'''
+UPSERT_HOLDING = '''
+    INSERT INTO holdings (name, symbol, quantity) VALUES (?, ?, ?)
+    ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity
+'''
+INSERT_HOLDING = 'INSERT INTO holdings (name, symbol, quantity) VALUES (?, ?, ?)'
+INSERT_TRANSACTION = '''
+    INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+INSERT_PORTFOLIO_SNAPSHOT = 'INSERT INTO portfolio_snapshots (name, datetime, value) VALUES (?, ?, ?)'
+
+# Every portfolio value is also folded into 5 minute, hourly and daily buckets as it is written
+ROLLUP_RESOLUTIONS = (300, 3600, 86400)
+UPSERT_PORTFOLIO_ROLLUP = '''
+    INSERT INTO portfolio_rollups (name, resolution, bucket, count, total, low, high, last)
+    VALUES (?, ?, datetime(CAST(strftime('%s', ?) AS INTEGER) / ? * ?, 'unixepoch'), 1, ?, ?, ?, ?)
+    ON CONFLICT (name, resolution, bucket) DO UPDATE SET
+        count = count + 1,
+        total = total + excluded.total,
+        low = min(low, excluded.low),
+        high = max(high, excluded.high),
+        last = excluded.last
+'''
+INSERT_EVENT = 'INSERT INTO account_events (name, type, format, data, timestamp) VALUES (?, ?, ?, ?, ?)'
+INSERT_ACCOUNT_SNAPSHOT = '''
+    INSERT OR REPLACE INTO account_snapshots (name, event_id, timestamp, format, state)
+    VALUES (?, ?, ?, ?, ?)
+'''
+INSERT_MARKET_PRICE = 'INSERT OR REPLACE INTO market_prices (date, symbol, close) VALUES (?, ?, ?)'
+
+
+def init_db():
+    with transaction(immediate=True) as conn:
+        migrated = migrate_legacy_accounts(conn)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS accounts (
+                name TEXT PRIMARY KEY,
+                balance REAL NOT NULL,
+                strategy TEXT NOT NULL DEFAULT '',
+                version INTEGER NOT NULL DEFAULT 0,
+                net_invested REAL NOT NULL DEFAULT 0.0
+            )
+        ''')
+        _add_column(conn, 'accounts', 'version', 'INTEGER NOT NULL DEFAULT 0')
+        # A copy of the ledger's running net_invested, so accounts can be valued without reading their ledgers
+        net_invested_added = _add_column(conn, 'accounts', 'net_invested', 'REAL NOT NULL DEFAULT 0.0')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS account_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                format INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            )
+        ''')
+        _add_column(conn, 'account_events', 'format', 'INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS account_events_by_name ON account_events (name, id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS account_snapshots (
+                name TEXT NOT NULL,
+                event_id INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                format INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                PRIMARY KEY (name, event_id)
+            ) WITHOUT ROWID
+        ''')
+        _add_column(conn, 'account_snapshots', 'format', 'INTEGER NOT NULL DEFAULT 0')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS holdings (
+                name TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (name, symbol)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price REAL NOT NULL,
+                timestamp TEXT NOT NULL,
+                rationale TEXT NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS transactions_by_name ON transactions (name, id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                datetime TEXT NOT NULL,
+                value REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS portfolio_snapshots_by_name ON portfolio_snapshots (name, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS portfolio_snapshots_by_datetime ON portfolio_snapshots (name, datetime)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_rollups (
+                name TEXT NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                total REAL NOT NULL,
+                low REAL NOT NULL,
+                high REAL NOT NULL,
+                last REAL NOT NULL,
+                PRIMARY KEY (name, resolution, bucket)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                datetime DATETIME,
+                type TEXT,
+                message TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS logs_by_name ON logs (name, id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS market_prices (
+                date TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                close REAL NOT NULL,
+                PRIMARY KEY (date, symbol)
+            ) WITHOUT ROWID
+        ''')
+        migrate_legacy_market(conn)
+        if migrated:
+            _insert_legacy_accounts(conn, migrated)
+            conn.execute('DROP TABLE accounts_legacy')
+            # init_db runs on import, in MCP servers too, whose stdout carries the JSON-RPC stream
+            print(f"Migrated {len(migrated)} accounts to the normalized ledger schema", file=sys.stderr)
+        if not conn.execute('SELECT 1 FROM portfolio_rollups LIMIT 1').fetchone():
+            _backfill_portfolio_rollups(conn)
+        _snapshot_unledgered_accounts(conn)
+        _backfill_aggregates(conn)
+        if migrated or net_invested_added:
+            _backfill_net_invested(conn)
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, declaration: str) -> bool:
+    """ Bring a table created by an earlier version of this module up to date; returns whether the column was added """
+    if column in [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]:
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return True
+
+
+def migrate_legacy_accounts(conn: sqlite3.Connection) -> list[tuple[str, dict]]:
+    """
+    Detect the original accounts table, which held one JSON blob per account, and move it aside.
+
+    Returns:
+        list: (name, account_dict) for every legacy row, ready to be inserted into the normalized tables
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(accounts)')]
+    if "account" not in columns:
+        return []
+    conn.execute('ALTER TABLE accounts RENAME TO accounts_legacy')
+    return [(name, json.loads(blob)) for name, blob in conn.execute('SELECT name, account FROM accounts_legacy')]
+
+
+def migrate_legacy_market(conn: sqlite3.Connection):
+    """ Move snapshots from the original market table, one JSON blob per date, into market_prices. """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market'").fetchone():
+        return
+    for date, blob in conn.execute('SELECT date, data FROM market').fetchall():
+        conn.executemany(INSERT_MARKET_PRICE, (
+            (date, symbol, close) for symbol, close in json.loads(blob).items() if close is not None
+        ))
+    conn.execute('DROP TABLE market')
+
+
+def _snapshot_unledgered_accounts(conn: sqlite3.Connection):
+    """
+    Give accounts written before the ledger existed a starting snapshot, taken from their stored state.
+    Their earlier history cannot be replayed, so as_of queries only reach back to this point.
+    """
+    names = [row[0] for row in conn.execute(
+        'SELECT name FROM accounts WHERE name NOT IN (SELECT DISTINCT name FROM account_snapshots)'
+    )]
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for name in names:
+        _write_snapshot(conn, name, 0, now, _read_projection(conn, name))
+
+
+def _backfill_aggregates(conn: sqlite3.Connection):
+    """
+    Snapshots taken before the ledger kept P&L aggregates lack them; work them out once from the
+    account's transactions and snapshot the current state with them filled in.
+    """
+    latest = conn.execute('''
+        SELECT name, format, state FROM account_snapshots AS s
+        WHERE event_id = (SELECT MAX(event_id) FROM account_snapshots WHERE name = s.name)
+    ''').fetchall()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for name, format, state in latest:
+        if "net_invested" in decode(format, state):
+            continue
+        state = _read_state(conn, name)
+        state.update(recompute_aggregates(read_transactions(name)))
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM account_events WHERE name = ?', (name,)).fetchone()[0]
+        _write_snapshot(conn, name, last_id, now, state)
+
+
+def _backfill_net_invested(conn: sqlite3.Connection):
+    """ Fill in the net_invested column for accounts stored before it existed, from their current ledger state """
+    names = [row[0] for row in conn.execute('SELECT name FROM accounts')]
+    conn.executemany('UPDATE accounts SET net_invested = ? WHERE name = ?', [
+        (((_read_state(conn, name) or {}).get("net_invested", 0.0)), name) for name in names
+    ])
+
+
+def _backfill_portfolio_rollups(conn: sqlite3.Connection):
+    for resolution in ROLLUP_RESOLUTIONS:
+        conn.execute('''
+            INSERT INTO portfolio_rollups (name, resolution, bucket, count, total, low, high, last)
+            SELECT name, ?, bucket, COUNT(*), SUM(value), MIN(value), MAX(value), value
+            FROM (
+                SELECT name, value, datetime(CAST(strftime('%s', datetime) AS INTEGER) / ? * ?, 'unixepoch') AS bucket
+                FROM portfolio_snapshots
+                ORDER BY id
+            )
+            GROUP BY name, bucket
+        ''', (resolution, resolution, resolution))
+
+
+def _insert_legacy_accounts(conn: sqlite3.Connection, legacy: list[tuple[str, dict]]):
+    conn.executemany(INSERT_ACCOUNT, [(name, account["balance"], account["strategy"], None) for name, account in legacy])
+    conn.executemany(INSERT_HOLDING, [
+        (name, symbol, quantity)
+        for name, account in legacy
+        for symbol, quantity in account["holdings"].items()
+    ])
+    conn.executemany(INSERT_TRANSACTION, [
+        (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+        for name, account in legacy
+        for t in account["transactions"]
+    ])
+    conn.executemany(INSERT_PORTFOLIO_SNAPSHOT, [
+        (name, dt, value)
+        for name, account in legacy
+        for dt, value in account["portfolio_value_time_series"]
+    ])
+
+
+def use_database(path: str):
+    """
+    Point this process at a different database file, creating the schema if needed.
+
+    Args:
+        path (str): A file path, or a sqlite URI such as "file:bench?mode=memory&cache=shared"
+    """
+    global DB
+    close_all()
+    DB = path
+    init_db()
+
+
+atexit.register(close_all)
+
+
+class ConcurrentUpdateError(Exception):
+    """ Raised when an account was changed by someone else between being read and being saved """
+
+
+def _write_snapshot(conn: sqlite3.Connection, name: str, event_id: int, timestamp: str, state: dict):
+    conn.execute(INSERT_ACCOUNT_SNAPSHOT, (name, event_id, timestamp, *encode(state)))
+
+def _append_events(conn: sqlite3.Connection, name: str, events: list[tuple[str, dict, str]], state: dict, snapshot: bool = False):
+    """
+    Append ledger events for an account, then snapshot its state if enough events have built up since the last one.
+
+    Args:
+        events (list): (type, data, timestamp) in the order they happened
+        state (dict): The account's state after the last of the events
+        snapshot (bool): Snapshot now regardless of how many events have built up
+    """
+    if not events:
+        return
+    conn.executemany(INSERT_EVENT, [(name, type, *encode(data), timestamp) for type, data, timestamp in events])
+    last_id = conn.execute('SELECT MAX(id) FROM account_events WHERE name = ?', (name,)).fetchone()[0]
+    since = conn.execute('''
+        SELECT COUNT(*) FROM account_events
+        WHERE name = ? AND id > COALESCE((SELECT MAX(event_id) FROM account_snapshots WHERE name = ?), 0)
+    ''', (name, name)).fetchone()[0]
+    if snapshot or since >= ACCOUNT_SNAPSHOT_EVERY:
+        _write_snapshot(conn, name, last_id, events[-1][2], state)
+
+def _read_state(conn: sqlite3.Connection, name: str, timestamp: str | None = None) -> dict | None:
+    """
+    Rebuild an account's balance, strategy and holdings from its newest snapshot and the events after it.
+
+    Args:
+        timestamp (str): Rebuild the state as it was at this time instead of now
+
+    Returns:
+        dict: The state, or None if the account has no ledger at that time
+    """
+    if timestamp is None:
+        row = conn.execute(
+            'SELECT event_id, format, state FROM account_snapshots WHERE name = ? ORDER BY event_id DESC LIMIT 1', (name,)
+        ).fetchone()
+    else:
+        row = conn.execute('''
+            SELECT event_id, format, state FROM account_snapshots
+            WHERE name = ? AND timestamp <= ?
+            ORDER BY event_id DESC LIMIT 1
+        ''', (name, timestamp)).fetchone()
+    if not row:
+        return None
+    event_id, format, state = row
+    events = conn.execute('''
+        SELECT type, format, data FROM account_events
+        WHERE name = ? AND id > ? AND timestamp <= ?
+        ORDER BY id
+    ''', (name, event_id, timestamp or "9999")).fetchall()
+    return replay(decode(format, state), ((type, decode(event_format, data)) for type, event_format, data in events))
+
+def _read_projection(conn: sqlite3.Connection, name: str) -> dict:
+    """ The account's current state from the accounts and holdings tables, for accounts written without a ledger """
+    balance, strategy = conn.execute('SELECT balance, strategy FROM accounts WHERE name = ?', (name,)).fetchone()
+    holdings = dict(conn.execute('SELECT symbol, quantity FROM holdings WHERE name = ?', (name,)).fetchall())
+    return {"balance": balance, "strategy": strategy, "holdings": holdings}
+
+def create_account(name: str, balance: float, strategy: str = "", timestamp: str | None = None):
+    """ Create an account with no holdings or history, unless it already exists, opened now or at the given time. """
+    name = name.lower()
+    now = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with transaction() as conn:
+        if conn.execute('INSERT OR IGNORE INTO accounts (name, balance, strategy) VALUES (?, ?, ?)', (name, balance, strategy)).rowcount:
+            state = {**empty_state(), "balance": balance, "strategy": strategy}
+            _append_events(conn, name, [(OPEN, state, now)], state, snapshot=True)
+
+def write_account(name, account_dict) -> int:
+    """
+    Replace everything stored for an account, including its transaction history and time series.
+    The ledger keeps its events, with a reset event marking the replacement.
+    Use save_account for incremental writes.
+
+    Returns:
+        int: The account's new version
+    """
+    name = name.lower()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    state = {"balance": account_dict["balance"], "strategy": account_dict["strategy"], "holdings": dict(account_dict["holdings"])}
+    state.update({key: account_dict[key] for key in AGGREGATES if key in account_dict})
+    with transaction() as conn:
+        conn.execute('DELETE FROM transactions WHERE name = ?', (name,))
+        conn.execute('DELETE FROM portfolio_snapshots WHERE name = ?', (name,))
+        conn.execute('DELETE FROM portfolio_rollups WHERE name = ?', (name,))
+        version = save_account(
+            name,
+            account_dict["balance"],
+            account_dict["strategy"],
+            account_dict["holdings"],
+            account_dict["transactions"],
+            account_dict["portfolio_value_time_series"],
+            aggregates={key: account_dict[key] for key in AGGREGATES if key in account_dict},
+        )
+        _append_events(conn, name, [(RESET, state, now)], state, snapshot=True)
+        return version
+
+def _replace_holdings(conn: sqlite3.Connection, name: str, holdings: dict[str, int]):
+    conn.execute('DELETE FROM holdings WHERE name = ?', (name,))
+    conn.executemany(INSERT_HOLDING, [(name, symbol, quantity) for symbol, quantity in holdings.items()])
+
+def _update_holdings(conn: sqlite3.Connection, name: str, before: dict[str, int], after: dict[str, int]):
+    """ Write only the positions that changed between two sets of holdings """
+    conn.executemany('DELETE FROM holdings WHERE name = ? AND symbol = ?', [
+        (name, symbol) for symbol in before if symbol not in after
+    ])
+    conn.executemany(UPSERT_HOLDING, [
+        (name, symbol, quantity) for symbol, quantity in after.items() if before.get(symbol) != quantity
+    ])
+
+def save_account(name: str, balance: float, strategy: str, holdings: dict[str, int], new_transactions: list[dict], new_snapshots: list[tuple[str, float]], version: int | None = None, events: list[tuple[str, dict, str]] = (), durable: bool = False, aggregates: dict | None = None, stored: dict | None = None) -> int:
+    """
+    Persist an account's current state, appending only the transactions, snapshots and ledger events not yet stored.
+
+    Args:
+        name (str): The account name
+        balance (float): The cash balance
+        strategy (str): The investment strategy
+        holdings (dict): Symbol to quantity for every current position
+        new_transactions (list): Transaction dicts recorded since the last save
+        new_snapshots (list): (datetime, value) pairs recorded since the last save
+        version (int): The version the caller read; the save only succeeds if the account is still at it.
+            None overwrites unconditionally.
+        events (list): (type, data, timestamp) ledger events recorded since the last save
+        durable (bool): Sync the commit to disk before returning
+        aggregates (dict): The running net_invested, cost_basis and realized_pnl, kept in ledger snapshots;
+            net_invested is also stored on the account row, for read_positions
+        stored (dict): The strategy and holdings as the caller last read or saved them; when given, only the
+            fields and positions that differ are written. Ignored when version is None.
+
+    Returns:
+        int: The account's new version
+
+    Raises:
+        ConcurrentUpdateError: If the account has moved on from the given version; nothing is written
+    """
+    name = name.lower()
+    net_invested = (aggregates or {}).get("net_invested")
+    with transaction(durable=durable) as conn:
+        if version is None:
+            conn.execute(INSERT_ACCOUNT, (name, balance, strategy, net_invested))
+            _replace_holdings(conn, name, holdings)
+        else:
+            if stored is not None and stored["strategy"] == strategy:
+                updated = conn.execute(UPDATE_ACCOUNT_BALANCE, (balance, net_invested, name, version)).rowcount
+            else:
+                updated = conn.execute(UPDATE_ACCOUNT, (balance, strategy, net_invested, name, version)).rowcount
+            if updated == 0:
+                raise ConcurrentUpdateError(f"Account {name} was modified since version {version}")
+            if stored is None:
+                _replace_holdings(conn, name, holdings)
+            else:
+                _update_holdings(conn, name, stored["holdings"], holdings)
+        conn.executemany(INSERT_TRANSACTION, [
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]) for t in new_transactions
+        ])
+        _insert_portfolio_snapshots(conn, name, new_snapshots)
+        _append_events(conn, name, list(events), {"balance": balance, "strategy": strategy, "holdings": holdings, **(aggregates or {})})
+        return conn.execute('SELECT version FROM accounts WHERE name = ?', (name,)).fetchone()[0]
+
+def _insert_portfolio_snapshots(conn: sqlite3.Connection, name: str, snapshots: list[tuple[str, float]]):
+    conn.executemany(INSERT_PORTFOLIO_SNAPSHOT, [(name, dt, value) for dt, value in snapshots])
+    conn.executemany(UPSERT_PORTFOLIO_ROLLUP, [
+        (name, resolution, dt, resolution, resolution, value, value, value, value)
+        for dt, value in snapshots
+        for resolution in ROLLUP_RESOLUTIONS
+    ])
+
+def append_portfolio_snapshots(name: str, snapshots: list[tuple[str, float]]):
+    """
+    Append portfolio values to an account's time series without touching its version.
+    A valuation changes nothing another writer could conflict with, so it needs no compare-and-swap.
+    """
+    with transaction() as conn:
+        _insert_portfolio_snapshots(conn, name.lower(), snapshots)
+
+def read_transactions(name: str, until: str = "9999") -> list[dict]:
+    rows = connect().execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ? AND timestamp <= ?
+        ORDER BY id
+    ''', (name.lower(), until)).fetchall()
+    return [
+        {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for symbol, quantity, price, timestamp, rationale in rows
+    ]
+
+def read_portfolio_snapshots(name: str, start: str = "", end: str = "9999") -> list[tuple[str, float]]:
+    """
+    Read raw portfolio values, optionally limited to a datetime range.
+
+    Args:
+        name (str): The account name
+        start (str): Earliest datetime to include, as YYYY-MM-DD HH:MM:SS
+        end (str): Latest datetime to include
+
+    Returns:
+        list: (datetime, value) pairs, oldest first
+    """
+    return connect().execute('''
+        SELECT datetime, value FROM portfolio_snapshots
+        WHERE name = ? AND datetime BETWEEN ? AND ?
+        ORDER BY datetime, id
+    ''', (name.lower(), start, end)).fetchall()
+
+def read_portfolio_rollups(name: str, resolution: int, start: str = "", end: str = "9999") -> list[tuple[str, float]]:
+    """
+    Read bucketed portfolio values at one of ROLLUP_RESOLUTIONS.
+
+    Returns:
+        list: (bucket start datetime, average value) pairs, oldest first
+    """
+    return connect().execute('''
+        SELECT bucket, total / count FROM portfolio_rollups
+        WHERE name = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+        ORDER BY bucket
+    ''', (name.lower(), resolution, start, end)).fetchall()
+
+def count_portfolio_points(name: str, resolution: int | None, start: str = "", end: str = "9999") -> int:
+    """ How many points a range holds at a resolution, or in the raw series if resolution is None """
+    conn = connect()
+    if resolution is None:
+        return conn.execute(
+            'SELECT COUNT(*) FROM portfolio_snapshots WHERE name = ? AND datetime BETWEEN ? AND ?', (name.lower(), start, end)
+        ).fetchone()[0]
+    return conn.execute(
+        'SELECT COUNT(*) FROM portfolio_rollups WHERE name = ? AND resolution = ? AND bucket BETWEEN ? AND ?',
+        (name.lower(), resolution, start, end),
+    ).fetchone()[0]
+
+def first_portfolio_datetime(name: str) -> str | None:
+    return connect().execute(
+        'SELECT MIN(bucket) FROM portfolio_rollups WHERE name = ? AND resolution = ?', (name.lower(), ROLLUP_RESOLUTIONS[-1])
+    ).fetchone()[0]
+
+def prune_portfolio_series(raw_before: str, rollups_before: dict[int, str]) -> int:
+    """
+    Delete raw portfolio values and rollup buckets that have aged out of their tier.
+
+    Args:
+        raw_before (str): Raw values older than this datetime are deleted
+        rollups_before (dict): Resolution to the datetime before which its buckets are deleted
+
+    Returns:
+        int: The number of rows deleted
+    """
+    with transaction() as conn:
+        deleted = conn.execute('DELETE FROM portfolio_snapshots WHERE datetime < ?', (raw_before,)).rowcount
+        for resolution, before in rollups_before.items():
+            deleted += conn.execute(
+                'DELETE FROM portfolio_rollups WHERE resolution = ? AND bucket < ?', (resolution, before)
+            ).rowcount
+    return deleted
+
+def read_account(name, transactions: bool = True, time_series: bool = True):
+    """
+    Read an account, optionally skipping its history.
+
+    Args:
+        name (str): The account name
+        transactions (bool): Load the full transaction list; otherwise it is returned empty
+        time_series (bool): Load the portfolio value time series; otherwise it is returned empty
+
+    The balance, strategy and holdings are replayed from the ledger: the newest snapshot plus the events after it.
+
+    Returns:
+        dict: The account fields and its version, read as one consistent snapshot, or None if the account does not exist
+    """
+    name = name.lower()
+    with transaction() as conn:
+        row = conn.execute('SELECT version FROM accounts WHERE name = ?', (name,)).fetchone()
+        if not row:
+            return None
+        state = _read_state(conn, name) or _read_projection(conn, name)
+        return {
+            "name": name,
+            **state,
+            "transactions": read_transactions(name) if transactions else [],
+            "portfolio_value_time_series": read_portfolio_snapshots(name) if time_series else [],
+            "version": row[0],
+        }
+
+def read_positions(names: list[str] | None = None) -> tuple[list[tuple[str, float, float]], list[tuple[str, str, int]]]:
+    """
+    Read what is needed to value many accounts at once, in two queries rather than one load per account.
+    net_invested is the running aggregate stored on each account row, so no transactions are read.
+
+    Args:
+        names (list): The accounts to read; all of them if None
+
+    Returns:
+        tuple: (name, balance, net_invested) for each account, and (name, symbol, quantity) for each holding
+    """
+    where, params = "", ()
+    if names is not None:
+        params = tuple(name.lower() for name in names)
+        where = f"WHERE name IN ({', '.join('?' * len(params))})"
+    with transaction() as conn:
+        accounts = conn.execute(f'SELECT name, balance, net_invested FROM accounts {where} ORDER BY name', params).fetchall()
+        holdings = conn.execute(f'SELECT name, symbol, quantity FROM holdings {where} ORDER BY name, symbol', params).fetchall()
+    return accounts, holdings
+
+def read_account_version(name: str) -> int | None:
+    """ The account's stored version, or None if it does not exist; a cheap check that a cached copy is current """
+    row = connect().execute('SELECT version FROM accounts WHERE name = ?', (name.lower(),)).fetchone()
+    return row[0] if row else None
+
+def read_account_as_of(name: str, timestamp: str) -> dict | None:
+    """
+    Reconstruct an account as it stood at a point in time, from the ledger.
+
+    Args:
+        name (str): The account name
+        timestamp (str): The point in time, as YYYY-MM-DD HH:MM:SS
+
+    Returns:
+        dict: The account fields, with the transactions made up to that time, or None if the ledger does not reach back that far
+    """
+    name = name.lower()
+    with transaction() as conn:
+        state = _read_state(conn, name, timestamp)
+        if state is None:
+            return None
+        return {
+            "name": name,
+            **state,
+            "transactions": read_transactions(name, until=timestamp),
+            "portfolio_value_time_series": [],
+        }
+
+INSERT_LOG = 'INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)'
+
+
+class LogWriter:
+    """
+    Buffers log entries in a bounded queue and writes them from a background thread,
+    one multi-row transaction per batch. Callers only pay for a queue put; if the queue
+    is full they block until the writer catches up.
+    """
+
+    def __init__(self, max_rows: int = LOG_FLUSH_ROWS, interval: float = LOG_FLUSH_SECONDS, maxsize: int = LOG_QUEUE_SIZE):
+        self.max_rows = max_rows
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def write(self, name: str, type: str, message: str):
+        self._ensure_started()
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self.queue.put((name.lower(), now, type, message))
+
+    def flush(self, timeout: float | None = 10.0):
+        """ Block until everything written so far is committed. """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """ Flush pending entries and stop the background thread. """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.flush()
+        self.queue.put(None)
+        self._thread.join(timeout=10.0)
+        self._thread = None
+
+    def _run(self):
+        running = True
+        while running:
+            batch, waiters = [], []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_rows:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, batch: list[tuple]):
+        if not batch:
+            return
+        try:
+            with transaction() as conn:
+                conn.executemany(INSERT_LOG, batch)
+        except sqlite3.Error as e:
+            print(f"Was not able to write {len(batch)} log entries due to {e}", file=sys.stderr)
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.close)
+
+
+def stop_on_sigterm():
+    """
+    Handle SIGTERM as an orderly exit: write the pending log entries, then raise SystemExit so that the
+    atexit hooks run too. MCP clients stop their stdio servers with SIGTERM, which otherwise ends the
+    process without either. Call from a process's entry point, since only the main thread can set it.
+    """
+    def handle(signum, frame):
+        log_writer.close()
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handle)
+
 
-def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
 def write_log(name: str, type: str, message: str):
     """
     Write a log entry to the logs table.
-    
+    The entry is timestamped now and committed shortly afterwards by the background log writer.
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    log_writer.write(name, type, message)
+
+def flush():
+    """ Wait until every log entry written by this process is in the database. """
+    log_writer.flush()
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    rows = connect().execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n)).fetchall()
+    return reversed(rows)
+
+def read_log_since(name: str, last_id: int = 0, limit: int = 100) -> list[tuple[int, str, str, str]]:
+    """
+    Read the log entries for a given name added after a cursor.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_id (int): The id of the last entry the caller has seen, or 0 to start from the latest entries
+        limit (int): The maximum number of entries to return; if more are new, only the latest are returned
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    rows = connect().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_id, limit)).fetchall()
+    rows.reverse()
+    return rows
 
 def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
+    """
+    Store the closing prices for a date, one row per symbol.
+
+    Args:
+        date (str): The date the snapshot is for, as YYYY-MM-DD
+        data (dict): Symbol to closing price
+    """
+    with transaction() as conn:
+        conn.executemany(INSERT_MARKET_PRICE, ((date, symbol, close) for symbol, close in data.items() if close is not None))
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    rows = connect().execute('SELECT symbol, close FROM market_prices WHERE date = ?', (date,)).fetchall()
+    return dict(rows) if rows else None
+
+def read_market_history(start: str = "", end: str = "9999") -> dict[str, dict[str, float]]:
+    """
+    Read every stored closing price between two dates.
+
+    Returns:
+        dict: Date to a dict of symbol to closing price, for each date with a snapshot
+    """
+    history = {}
+    rows = connect().execute(
+        'SELECT date, symbol, close FROM market_prices WHERE date BETWEEN ? AND ? ORDER BY date', (start, end)
+    )
+    for date, symbol, close in rows:
+        history.setdefault(date, {})[symbol] = close
+    return history
+
+def has_market(date: str) -> bool:
+    return connect().execute('SELECT 1 FROM market_prices WHERE date = ? LIMIT 1', (date,)).fetchone() is not None
+
+def read_market_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    """
+    Look up the closing prices of several symbols in one query.
+
+    Returns:
+        dict: Symbol to closing price, for the symbols in the snapshot for that date
+    """
+    if not symbols:
+        return {}
+    placeholders = ", ".join("?" * len(symbols))
+    rows = connect().execute(
+        f'SELECT symbol, close FROM market_prices WHERE date = ? AND symbol IN ({placeholders})', (date, *symbols)
+    ).fetchall()
+    return dict(rows)
+
+def read_market_price(date: str, symbol: str) -> float | None:
+    """
+    Look up one closing price without loading the rest of the day's snapshot.
+
+    Returns:
+        float: The closing price, or None if the symbol is not in the snapshot for that date
+    """
+    row = connect().execute('SELECT close FROM market_prices WHERE date = ? AND symbol = ?', (date, symbol)).fetchone()
+    return row[0] if row else None
+
+
+init_db()
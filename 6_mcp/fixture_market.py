@@ -0,0 +1,58 @@
+"""
+Closing prices by date, held in memory: recorded history, a JSON file, or a synthetic random walk.
+
+The backtest replays them, and polygon_stub serves them in place of Polygon. Nothing here touches the
+database unless from_database() is called.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+
+class FixtureMarket:
+    """ Closing prices by date, served for whichever date the backtest has reached """
+
+    def __init__(self, closes: dict[str, dict[str, float]]):
+        if not closes:
+            raise ValueError("A fixture market needs at least one day of prices")
+        self.closes = closes
+        self.dates = sorted(closes)
+        self.today = self.dates[0]
+
+    @classmethod
+    def from_database(cls, start: str = "", end: str = "9999") -> "FixtureMarket":
+        """ The closing prices stored by write_market in the current database """
+        # Imported here so that using a fixture market does not open, or create, the database
+        from database import read_market_history
+        return cls(read_market_history(start, end))
+
+    @classmethod
+    def from_json(cls, path: str) -> "FixtureMarket":
+        """ A JSON file mapping each date to a dict of symbol to closing price """
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def synthetic(cls, symbols: int = 50, days: int = 250, seed: int = 0, start: str = "2024-01-02", names: list[str] = ()) -> "FixtureMarket":
+        """ A random walk over weekdays for the given names, then symbols S0, S1, ... up to the number asked for """
+        rng = random.Random(seed)
+        names = list(names)[:symbols] + [f"S{i}" for i in range(symbols - len(names))]
+        prices = {name: rng.uniform(10, 500) for name in names}
+        day = datetime.strptime(start, "%Y-%m-%d")
+        closes = {}
+        while len(closes) < days:
+            if day.weekday() < 5:
+                prices = {symbol: max(0.01, price * (1 + rng.gauss(0, 0.02))) for symbol, price in prices.items()}
+                closes[day.strftime("%Y-%m-%d")] = prices
+            day += timedelta(days=1)
+        return cls(closes)
+
+    def set_date(self, date: str):
+        self.today = date
+
+    def get_share_price(self, symbol: str) -> float:
+        return self.closes[self.today].get(symbol, 0.0)
+
+    def get_share_prices(self, symbols) -> dict[str, float]:
+        closes = self.closes[self.today]
+        return {symbol: closes.get(symbol, 0.0) for symbol in symbols}
@@ -0,0 +1,125 @@
+"""
+The account ledger: every change to an account is an event, and an account's state is whatever
+replaying its events produces. Replay starts from the newest compact snapshot, so loading an
+account only applies the few events recorded since.
+
+State is a dict with balance, strategy and holdings, plus running aggregates that each trade updates
+in constant time: net_invested (cash put into shares less cash taken out), cost_basis (the average cost
+of each open position) and realized_pnl (gains locked in by sales, against that average cost).
+"""
+
+OPEN = "open"
+RESET = "reset"
+DEPOSIT = "deposit"
+WITHDRAW = "withdraw"
+BUY = "buy"
+SELL = "sell"
+STRATEGY_CHANGE = "strategy_change"
+
+EVENT_TYPES = (OPEN, RESET, DEPOSIT, WITHDRAW, BUY, SELL, STRATEGY_CHANGE)
+
+
+AGGREGATES = ("net_invested", "cost_basis", "realized_pnl")
+
+
+def empty_state() -> dict:
+    return {"balance": 0.0, "strategy": "", "holdings": {}, "net_invested": 0.0, "cost_basis": {}, "realized_pnl": 0.0}
+
+
+def apply_trade(state: dict, type: str, symbol: str, quantity: int, price: float):
+    """
+    Update the running aggregates for a trade, in place. Call before the holdings change.
+
+    Args:
+        state (dict): holdings and the aggregates
+        type (str): BUY or SELL
+        symbol (str): The symbol traded
+        quantity (int): The number of shares, positive for both buys and sells
+        price (float): The price per share, including the spread
+    """
+    cost_basis = state["cost_basis"]
+    if type == BUY:
+        state["net_invested"] += price * quantity
+        cost_basis[symbol] = cost_basis.get(symbol, 0.0) + price * quantity
+    else:
+        held = state["holdings"].get(symbol, 0)
+        average = cost_basis.get(symbol, 0.0) / held if held else 0.0
+        state["net_invested"] -= price * quantity
+        state["realized_pnl"] += (price - average) * quantity
+        if held == quantity:
+            cost_basis.pop(symbol, None)
+        else:
+            cost_basis[symbol] = cost_basis.get(symbol, 0.0) - average * quantity
+
+
+def apply_event(state: dict, type: str, data: dict) -> dict:
+    """
+    Apply one event to a state, in place, using the same arithmetic as Account so replay is exact.
+
+    Args:
+        state (dict): balance, strategy and holdings
+        type (str): One of EVENT_TYPES
+        data (dict): The event payload
+
+    Returns:
+        dict: The updated state
+    """
+    holdings = state["holdings"]
+    if type in (OPEN, RESET):
+        state["balance"] = data["balance"]
+        state["strategy"] = data["strategy"]
+        state["holdings"] = dict(data["holdings"])
+        state["net_invested"] = data.get("net_invested", 0.0)
+        state["cost_basis"] = dict(data.get("cost_basis", {}))
+        state["realized_pnl"] = data.get("realized_pnl", 0.0)
+    elif type == DEPOSIT:
+        state["balance"] += data["amount"]
+    elif type == WITHDRAW:
+        state["balance"] -= data["amount"]
+    elif type == BUY:
+        apply_trade(state, BUY, data["symbol"], data["quantity"], data["price"])
+        holdings[data["symbol"]] = holdings.get(data["symbol"], 0) + data["quantity"]
+        state["balance"] -= data["price"] * data["quantity"]
+    elif type == SELL:
+        apply_trade(state, SELL, data["symbol"], data["quantity"], data["price"])
+        holdings[data["symbol"]] -= data["quantity"]
+        if holdings[data["symbol"]] == 0:
+            del holdings[data["symbol"]]
+        state["balance"] += data["price"] * data["quantity"]
+    elif type == STRATEGY_CHANGE:
+        state["strategy"] = data["strategy"]
+    else:
+        raise ValueError(f"Unknown ledger event {type}")
+    return state
+
+
+def replay(state: dict, events) -> dict:
+    """ Apply (type, data) events in order to a copy of the state """
+    state = {**empty_state(), **state}
+    state["holdings"] = dict(state["holdings"])
+    state["cost_basis"] = dict(state["cost_basis"])
+    for type, data in events:
+        apply_event(state, type, data)
+    return state
+
+
+def recompute_aggregates(transactions: list[dict]) -> dict:
+    """
+    Work out the aggregates from scratch, from an account's transactions in the order they were made.
+    Used to check the running values, and to fill them in for snapshots taken before they existed.
+
+    Args:
+        transactions (list): Transaction dicts, with negative quantities for sales
+
+    Returns:
+        dict: net_invested, cost_basis and realized_pnl
+    """
+    state = empty_state()
+    holdings = state["holdings"]
+    for t in transactions:
+        symbol, quantity = t["symbol"], t["quantity"]
+        apply_trade(state, BUY if quantity > 0 else SELL, symbol, abs(quantity), t["price"])
+        holdings[symbol] = holdings.get(symbol, 0) + quantity
+        if holdings[symbol] == 0:
+            del holdings[symbol]
+    return {key: state[key] for key in AGGREGATES}
@@ -0,0 +1,168 @@
+"""
+Retention for the logs table.
+
+Entries older than LOG_RETENTION_DAYS, or beyond the newest LOG_MAX_ROWS_PER_TRADER for a trader,
+are rolled up into one 'summary' row per run and then deleted. Each run is compacted in its own
+short transaction, so the log writer and the traders are never held up for long, and the freed
+pages are then returned to the filesystem with an incremental vacuum.
+
+Usage: uv run log_retention.py [--vacuum]
+(--vacuum runs a one-off full VACUUM, needed once for databases created before incremental vacuum was enabled)
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from database import connect, transaction
+
+load_dotenv(override=True)
+
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "7"))
+LOG_MAX_ROWS_PER_TRADER = int(os.getenv("LOG_MAX_ROWS_PER_TRADER", "20000"))
+LOG_DELETE_BATCH = int(os.getenv("LOG_DELETE_BATCH", "2000"))
+VACUUM_PAGES_PER_STEP = 256
+
+SUMMARY = "summary"
+
+
+def _cutoff(name: str, max_age_days: float, max_rows: int) -> int:
+    """ The highest log id for this trader that falls outside the retention window, or 0 """
+    conn = connect()
+    oldest_kept = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+    by_age = conn.execute(
+        "SELECT MAX(id) FROM logs WHERE name = ? AND type != ? AND datetime < ?", (name, SUMMARY, oldest_kept)
+    ).fetchone()[0] or 0
+    by_count = conn.execute(
+        "SELECT id FROM logs WHERE name = ? AND type != ? ORDER BY id DESC LIMIT 1 OFFSET ?", (name, SUMMARY, max_rows)
+    ).fetchone()
+    return max(by_age, by_count[0] if by_count else 0)
+
+
+def _runs(name: str, cutoff: int) -> list[tuple[int, int, str]]:
+    """
+    Split this trader's entries up to the cutoff into runs, each starting at a trace 'Started' entry.
+    A run still in progress at the cutoff is left alone, so only complete runs are rolled up.
+
+    Returns:
+        list: (first_id, last_id, label) for each run
+    """
+    conn = connect()
+    starts = conn.execute('''
+        SELECT id, message FROM logs
+        WHERE name = ? AND type = 'trace' AND message LIKE 'Started:%'
+        ORDER BY id
+    ''', (name,)).fetchall()
+    later = [id for id, _ in starts if id > cutoff]
+    earlier = [id for id, _ in starts if id <= cutoff]
+    if earlier and not (later and later[0] == cutoff + 1):
+        end = earlier[-1] - 1
+    else:
+        end = cutoff
+    first = conn.execute(
+        "SELECT MIN(id) FROM logs WHERE name = ? AND type != ?", (name, SUMMARY)
+    ).fetchone()[0]
+    if first is None or first > end:
+        return []
+    runs = []
+    previous_start, previous_label = first, "Entries before first run"
+    for id, message in starts:
+        if id > end:
+            break
+        if id > previous_start:
+            runs.append((previous_start, id - 1, previous_label))
+        previous_start, previous_label = id, message.removeprefix("Started:").strip()
+    runs.append((previous_start, end, previous_label))
+    return runs
+
+
+def _compact_run(name: str, first_id: int, last_id: int, label: str) -> int:
+    """
+    Replace one run's entries with a single summary entry, which takes over the run's first id
+    so that it sorts where the run used to be. Returns the number of entries deleted.
+    """
+    with transaction(immediate=True) as conn:
+        counts = conn.execute('''
+            SELECT type, COUNT(*), MIN(datetime) FROM logs
+            WHERE name = ? AND id BETWEEN ? AND ? AND type != ?
+            GROUP BY type
+            ORDER BY type
+        ''', (name, first_id, last_id, SUMMARY)).fetchall()
+        if not counts:
+            return 0
+        deleted = sum(count for _, count, _ in counts)
+        started = min(started for _, _, started in counts)
+        message = f"{label}: " + ", ".join(f"{count} {type}" for type, count, _ in counts)
+        conn.execute(
+            "DELETE FROM logs WHERE name = ? AND id BETWEEN ? AND ? AND type != ?", (name, first_id, last_id, SUMMARY)
+        )
+        conn.execute(
+            "INSERT INTO logs (id, name, datetime, type, message) VALUES (?, ?, ?, ?, ?)",
+            (first_id, name, started, SUMMARY, message),
+        )
+    return deleted
+
+
+def _database_size() -> int:
+    conn = connect()
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def incremental_vacuum() -> int:
+    """ Release free pages back to the filesystem a few at a time. Returns the number of pages released. """
+    conn = connect()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # Databases created before auto_vacuum=INCREMENTAL need one full VACUUM to switch over
+        return 0
+    initial = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free:
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})").fetchall()
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+        time.sleep(0)
+    return initial - free
+
+
+def compact_logs(max_age_days: float = LOG_RETENTION_DAYS, max_rows: int = LOG_MAX_ROWS_PER_TRADER, batch_size: int = LOG_DELETE_BATCH) -> dict:
+    """
+    Apply the retention policy to every trader's logs.
+
+    Args:
+        max_age_days (float): Entries older than this are rolled up
+        max_rows (int): Entries beyond the newest max_rows per trader are rolled up
+        batch_size (int): After deleting this many entries the job pauses briefly, so queued writers get the lock
+
+    Returns:
+        dict: Entries deleted, summaries written, pages released and bytes reclaimed
+    """
+    size_before = _database_size()
+    deleted = summaries = 0
+    names = [row[0] for row in connect().execute("SELECT DISTINCT name FROM logs")]
+    for name in names:
+        cutoff = _cutoff(name, max_age_days, max_rows)
+        pending = 0
+        for first_id, last_id, label in _runs(name, cutoff):
+            removed = _compact_run(name, first_id, last_id, label)
+            deleted += removed
+            summaries += 1 if removed else 0
+            pending += removed
+            if pending >= batch_size:
+                pending = 0
+                time.sleep(0.01)
+    pages = incremental_vacuum()
+    return {
+        "deleted": deleted,
+        "summaries": summaries,
+        "pages_released": pages,
+        "bytes_reclaimed": max(size_before - _database_size(), 0),
+    }
+
+
+if __name__ == "__main__":
+    if "--vacuum" in sys.argv:
+        connect().execute("VACUUM")
+    result = compact_logs()
+    print(f"Deleted {result['deleted']:,} log entries into {result['summaries']:,} run summaries; "
+          f"reclaimed {result['bytes_reclaimed'] / 1024:,.0f} KiB")
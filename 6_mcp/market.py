@@ -1,9 +1,15 @@
 from polygon import RESTClient
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import os
+import time
+import asyncio
+import threading
+import httpx
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 import random
-from database import write_market, read_market
+from database import write_market, read_market, has_market, read_market_price, read_market_prices, run_async
 from functools import lru_cache
 
 load_dotenv(override=True)
@@ -14,13 +20,91 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# How long a live price is served from memory, and how much longer it may be served stale while it is
+# refreshed in the background. A paid plan's snapshots are 15 minutes delayed and only move once a minute,
+# so a minute adds little; a realtime plan's prices are only worth a few seconds.
+PRICE_CACHE_DEFAULTS = {"realtime": (2.0, 10.0), "paid": (60.0, 300.0)}
+default_ttl, default_stale = PRICE_CACHE_DEFAULTS.get(polygon_plan, PRICE_CACHE_DEFAULTS["paid"])
+PRICE_CACHE_TTL_SECONDS = float(os.getenv("PRICE_CACHE_TTL_SECONDS", default_ttl))
+PRICE_CACHE_STALE_SECONDS = float(os.getenv("PRICE_CACHE_STALE_SECONDS", default_stale))
+
+# Every Polygon request goes through one client per process, sync or async, which keeps its connections
+# alive between calls. Failed connections and the statuses below are retried, waiting
+# POLYGON_BACKOFF_SECONDS, then twice that, and so on.
+# POLYGON_BASE_URL can point at a stand-in such as polygon_stub.py for load testing
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_CONNECT_TIMEOUT = float(os.getenv("POLYGON_CONNECT_TIMEOUT", "5"))
+POLYGON_READ_TIMEOUT = float(os.getenv("POLYGON_READ_TIMEOUT", "10"))
+POLYGON_RETRIES = int(os.getenv("POLYGON_RETRIES", "3"))
+POLYGON_BACKOFF_SECONDS = float(os.getenv("POLYGON_BACKOFF_SECONDS", "0.5"))
+POLYGON_MAX_CONNECTIONS = int(os.getenv("POLYGON_MAX_CONNECTIONS", "10"))
+RETRY_STATUSES = (413, 429, 499, 500, 502, 503, 504)
+
+# The longest a lookup waits on a fetch another caller started; past that it fails rather than hang
+PRICE_CACHE_WAIT_SECONDS = float(os.getenv(
+    "PRICE_CACHE_WAIT_SECONDS", (POLYGON_CONNECT_TIMEOUT + POLYGON_READ_TIMEOUT) * (POLYGON_RETRIES + 1)
+))
+
+@lru_cache(maxsize=1)
+def polygon_client() -> RESTClient:
+    """ The process-wide Polygon client """
+    client = RESTClient(
+        polygon_api_key, connect_timeout=POLYGON_CONNECT_TIMEOUT, read_timeout=POLYGON_READ_TIMEOUT,
+        retries=POLYGON_RETRIES, base=POLYGON_BASE_URL,
+    )
+    # RESTClient keeps its timeouts without passing them to requests, backs off from a fixed 0.1s, and
+    # only sizes the number of pools (one per host), each of which keeps a single connection; set all
+    # three on its connection pool, before the first request creates it
+    client.client.connection_pool_kw["maxsize"] = POLYGON_MAX_CONNECTIONS
+    client.client.connection_pool_kw["timeout"] = client.timeout
+    client.client.connection_pool_kw["retries"] = Retry(
+        total=POLYGON_RETRIES, status_forcelist=RETRY_STATUSES, backoff_factor=POLYGON_BACKOFF_SECONDS,
+    )
+    return client
+
+# The async client is bound to the event loop it was made on
+_async_client: tuple[asyncio.AbstractEventLoop, httpx.AsyncClient] | None = None
+
+def polygon_async_client() -> httpx.AsyncClient:
+    """ The Polygon client for the running event loop """
+    global _async_client
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client[0] is not loop or _async_client[1].is_closed:
+        client = httpx.AsyncClient(
+            base_url=POLYGON_BASE_URL,
+            headers={"Authorization": f"Bearer {polygon_api_key}", "Accept-Encoding": "gzip"},
+            timeout=httpx.Timeout(POLYGON_READ_TIMEOUT, connect=POLYGON_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=POLYGON_MAX_CONNECTIONS),
+        )
+        _async_client = (loop, client)
+    return _async_client[1]
+
+async def apolygon_get(path: str, params: dict | None = None) -> dict:
+    """ GET a Polygon endpoint and decode the JSON response, retrying with backoff as the sync client does """
+    client = polygon_async_client()
+    for attempt in range(POLYGON_RETRIES + 1):
+        last_attempt = attempt == POLYGON_RETRIES
+        try:
+            response = await client.get(path, params=params)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                response.raise_for_status()
+                return response.json()
+        await asyncio.sleep(POLYGON_BACKOFF_SECONDS * 2 ** attempt)
+
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
-    market_status = client.get_market_status()
+    market_status = polygon_client().get_market_status()
     return market_status.market == "open"
 
+async def ais_market_open() -> bool:
+    market_status = await apolygon_get("/v1/marketstatus/now")
+    return market_status.get("market") == "open"
+
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
-    client = RESTClient(polygon_api_key)
+    client = polygon_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp/1000).date()
@@ -29,26 +113,211 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
     return {result.ticker: result.close for result in results}
 
 @lru_cache(maxsize=2)
+def ensure_market_for_prior_date(today) -> str:
+    if not has_market(today):
+        write_market(today, get_all_share_prices_polygon_eod())
+    return today
+
 def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+    ensure_market_for_prior_date(today)
+    return read_market(today)
 
 def get_share_price_polygon_eod(symbol) -> float:
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    today = ensure_market_for_prior_date(datetime.now().date().strftime("%Y-%m-%d"))
+    return read_market_price(today, symbol) or 0.0
+
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = ensure_market_for_prior_date(datetime.now().date().strftime("%Y-%m-%d"))
+    prices = read_market_prices(today, symbols)
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
+    client = polygon_client()
     result = client.get_snapshot_ticker("stocks", symbol)
     return result.min.close
 
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    client = polygon_client()
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    prices = {result.ticker: result.min.close for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+async def aget_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    results = await apolygon_get("/v2/snapshot/locale/us/markets/stocks/tickers", {"tickers": ",".join(symbols)})
+    prices = {result["ticker"]: result["min"]["c"] for result in results.get("tickers", [])}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
+class PriceCache:
+    """
+    Live prices by symbol. A price is fresh for ttl seconds; for stale seconds after that it is still
+    served, while a background thread fetches a new one. Older prices, and symbols never seen, are
+    fetched before returning.
+
+    Lookups are single-flight: a symbol already being fetched is waited for rather than requested again,
+    so a burst of lookups for one symbol makes one upstream request.
+    """
+
+    def __init__(self, fetch, afetch=None, ttl: float = PRICE_CACHE_TTL_SECONDS, stale: float = PRICE_CACHE_STALE_SECONDS,
+                 wait: float = PRICE_CACHE_WAIT_SECONDS):
+        """
+        Args:
+            fetch: Called with a list of symbols; returns a dict of symbol to price
+            afetch: An async version of fetch, for aget_many; fetch is run in a thread if None
+            ttl (float): Seconds a price is served without being refreshed
+            stale (float): Further seconds a price is served while it is refreshed in the background
+            wait (float): Seconds to wait on a fetch another caller started before giving up
+        """
+        self.fetch = fetch
+        self.afetch = afetch
+        self.wait = wait
+        self.ttl = ttl
+        self.stale = stale
+        # symbol -> (price, time.monotonic() when fetched)
+        self.prices: dict[str, tuple[float, float]] = {}
+        # symbol -> the Future of the fetch that will price it
+        self.in_flight: dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price-refresh")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def get(self, symbol: str) -> float:
+        return self.get_many([symbol])[symbol]
+
+    async def aget(self, symbol: str) -> float:
+        return (await self.aget_many([symbol]))[symbol]
+
+    def get_many(self, symbols: list[str]) -> dict[str, float]:
+        """ Prices for the symbols, from memory where possible, fetching the rest in one request """
+        prices, waiting, fetch, fetching = self._plan(symbols)
+        if fetch:
+            self._settle(fetch, fetching, self.fetch)
+            prices.update(fetching.result())
+        for symbol, future in waiting.items():
+            prices[symbol] = future.result(timeout=self.wait)[symbol]
+        return prices
+
+    async def aget_many(self, symbols: list[str]) -> dict[str, float]:
+        """ As get_many, awaiting the fetch instead of blocking """
+        prices, waiting, fetch, fetching = self._plan(symbols)
+        if fetch:
+            try:
+                if self.afetch:
+                    result = await self.afetch(fetch)
+                else:
+                    result = await asyncio.to_thread(self.fetch, fetch)
+            except BaseException as e:
+                # Cancellation included: whoever is waiting on this fetch must hear that it ended
+                self._settle(fetch, fetching, error=e)
+                raise
+            self._settle(fetch, fetching, result=result)
+            prices.update(fetching.result())
+        for symbol, future in waiting.items():
+            # Shielded, so that giving up here does not cancel the fetch for everyone else waiting on it
+            prices[symbol] = (await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait))[symbol]
+        return prices
+
+    def _plan(self, symbols: list[str]) -> tuple[dict[str, float], dict[str, Future], list[str], Future]:
+        """
+        Sort the symbols by what a lookup has to do, and start refreshing the stale ones in the background.
+
+        Returns:
+            tuple: The prices to hand, the fetches already under way to wait for by symbol,
+                the symbols the caller must fetch, and the Future to settle once it has
+        """
+        prices, waiting, fetch, refresh = {}, {}, [], []
+        now = time.monotonic()
+        with self.lock:
+            for symbol in symbols:
+                entry = self.prices.get(symbol)
+                age = now - entry[1] if entry else None
+                if entry and age < self.ttl:
+                    self.hits += 1
+                    prices[symbol] = entry[0]
+                elif entry and age < self.ttl + self.stale:
+                    self.stale_hits += 1
+                    prices[symbol] = entry[0]
+                    if symbol not in self.in_flight:
+                        refresh.append(symbol)
+                elif symbol in self.in_flight:
+                    self.coalesced += 1
+                    waiting[symbol] = self.in_flight[symbol]
+                else:
+                    self.misses += 1
+                    fetch.append(symbol)
+            refreshing = self._start(refresh)
+            fetching = self._start(fetch)
+            self.fetches += bool(refresh) + bool(fetch)
+        if refresh:
+            self.refresher.submit(self._settle, refresh, refreshing, self.fetch)
+        return prices, waiting, fetch, fetching
+
+    def _start(self, symbols: list[str]) -> Future:
+        """ Mark the symbols as being fetched; call with the lock held """
+        future = Future()
+        for symbol in symbols:
+            self.in_flight[symbol] = future
+        return future
+
+    def _settle(self, symbols: list[str], future: Future, fetch=None, result: dict | None = None, error: BaseException | None = None):
+        """
+        Store the prices from a fetch, calling fetch if given, and pass them, or its error, to whoever waits on future.
+        The symbols are no longer in flight afterwards, however the fetch ended.
+        """
+        interrupted = None
+        if fetch:
+            try:
+                result = fetch(symbols)
+            except BaseException as e:
+                error = e
+        if error is not None and not isinstance(error, Exception):
+            # A cancellation or interrupt belongs to the caller it happened to; waiters get an ordinary error
+            interrupted = error
+            error = RuntimeError(f"The price fetch for {', '.join(symbols)} was interrupted")
+        fetched_at = time.monotonic()
+        with self.lock:
+            for symbol in symbols:
+                self.in_flight.pop(symbol, None)
+                if error is None:
+                    self.prices[symbol] = (result[symbol], fetched_at)
+            if error is not None:
+                self.errors += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        if interrupted is not None and fetch:
+            raise interrupted
+
+    def clear(self):
+        with self.lock:
+            self.prices.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.prices),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "ttl_seconds": self.ttl,
+            "stale_seconds": self.stale,
+        }
+
+
+price_cache = PriceCache(get_share_prices_polygon_min, aget_share_prices_polygon_min)
+
+
 def get_share_price_polygon(symbol) -> float:
-    if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
+    if is_paid_polygon or is_realtime_polygon:
+        return price_cache.get(symbol)
     else:
         return get_share_price_polygon_eod(symbol)
 
@@ -58,4 +327,36 @@ def get_share_price(symbol) -> float:
             return get_share_price_polygon(symbol)
         except Exception as e:
             print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
\ No newline at end of file
+    return float(random.randint(1, 100))
+
+async def aget_share_price(symbol) -> float:
+    """ As get_share_price, without blocking the event loop """
+    return (await aget_share_prices([symbol]))[symbol]
+
+def get_share_prices(symbols) -> dict[str, float]:
+    """ The prices of several symbols, fetched together: from the price cache, which makes at most one snapshot call, on a paid or realtime plan; one query against the EOD map otherwise """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if polygon_api_key:
+        try:
+            if is_paid_polygon or is_realtime_polygon:
+                return price_cache.get_many(symbols)
+            return get_share_prices_polygon_eod(symbols)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using random numbers")
+    return {symbol: float(random.randint(1, 100)) for symbol in symbols}
+
+async def aget_share_prices(symbols) -> dict[str, float]:
+    """ As get_share_prices, without blocking the event loop: live prices are awaited, the EOD map is read in a thread """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if polygon_api_key:
+        try:
+            if is_paid_polygon or is_realtime_polygon:
+                return await price_cache.aget_many(symbols)
+            return await run_async(get_share_prices_polygon_eod, symbols)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using random numbers")
+    return {symbol: float(random.randint(1, 100)) for symbol in symbols}
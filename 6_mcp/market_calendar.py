@@ -0,0 +1,167 @@
+"""
+The NYSE trading calendar, worked out locally: regular sessions, holidays and early closes.
+
+Sessions run 9:30 to 16:00 New York time on weekdays, closing at 13:00 on the day before Independence
+Day, the day after Thanksgiving and Christmas Eve. Holidays follow the exchange's rules: one falling on
+a Saturday is observed on the Friday before (except New Year's Day), and one on a Sunday on the Monday
+after. One-off closures, such as national days of mourning, are listed in SPECIAL_CLOSURES.
+
+Nothing here touches the network. With MARKET_CALENDAR_CROSS_CHECK set, acheck_open() also asks Polygon
+and trusts it when the two disagree, which catches closures announced after this list was written.
+"""
+import os
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+MARKET_CALENDAR_CROSS_CHECK = os.getenv("MARKET_CALENDAR_CROSS_CHECK", "false").strip().lower() == "true"
+
+EXCHANGE_TIMEZONE = ZoneInfo("America/New_York")
+OPEN_TIME = time(9, 30)
+CLOSE_TIME = time(16, 0)
+EARLY_CLOSE_TIME = time(13, 0)
+
+SPECIAL_CLOSURES = {
+    date(2012, 10, 29): "Hurricane Sandy",
+    date(2012, 10, 30): "Hurricane Sandy",
+    date(2018, 12, 5): "National Day of Mourning for George H.W. Bush",
+    date(2025, 1, 9): "National Day of Mourning for Jimmy Carter",
+}
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """ The nth given weekday (Monday is 0) of the month; n = -1 for the last """
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """ Easter Sunday, by the anonymous Gregorian algorithm """
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day: date) -> date:
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=32)
+def holidays(year: int) -> dict[date, str]:
+    """ The exchange's full-day closures in a year, by date """
+    days = {}
+    new_year = date(year, 1, 1)
+    # A New Year's Day on a Saturday is not observed: the Friday before ends the previous year
+    if new_year.weekday() != 5:
+        days[_observed(new_year)] = "New Year's Day"
+    if year >= 1998:
+        days[_nth_weekday(year, 1, 0, 3)] = "Martin Luther King Jr. Day"
+    days[_nth_weekday(year, 2, 0, 3)] = "Washington's Birthday"
+    days[_easter(year) - timedelta(days=2)] = "Good Friday"
+    days[_nth_weekday(year, 5, 0, -1)] = "Memorial Day"
+    if year >= 2022:
+        days[_observed(date(year, 6, 19))] = "Juneteenth"
+    days[_observed(date(year, 7, 4))] = "Independence Day"
+    days[_nth_weekday(year, 9, 0, 1)] = "Labor Day"
+    days[_nth_weekday(year, 11, 3, 4)] = "Thanksgiving Day"
+    days[_observed(date(year, 12, 25))] = "Christmas Day"
+    days.update({day: name for day, name in SPECIAL_CLOSURES.items() if day.year == year})
+    return days
+
+
+@lru_cache(maxsize=32)
+def early_closes(year: int) -> set[date]:
+    """ The days in a year the exchange closes at EARLY_CLOSE_TIME """
+    candidates = (
+        date(year, 7, 3),
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1),
+        date(year, 12, 24),
+    )
+    return {day for day in candidates if is_trading_day(day)}
+
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def session(day: date) -> tuple[datetime, datetime] | None:
+    """ The open and close of the session on a day, in exchange time, or None if the exchange is closed all day """
+    if not is_trading_day(day):
+        return None
+    close = EARLY_CLOSE_TIME if day in early_closes(day.year) else CLOSE_TIME
+    return (
+        datetime.combine(day, OPEN_TIME, tzinfo=EXCHANGE_TIMEZONE),
+        datetime.combine(day, close, tzinfo=EXCHANGE_TIMEZONE),
+    )
+
+
+def _exchange_time(at: datetime | None) -> datetime:
+    """ A moment in exchange time; naive datetimes are taken to be in the local time zone """
+    if at is None:
+        return datetime.now(EXCHANGE_TIMEZONE)
+    return at.astimezone(EXCHANGE_TIMEZONE)
+
+
+def is_open(at: datetime | None = None) -> bool:
+    """ Whether the regular session is under way at a moment, now by default """
+    at = _exchange_time(at)
+    hours = session(at.date())
+    return hours is not None and hours[0] <= at < hours[1]
+
+
+def next_open(after: datetime | None = None) -> datetime:
+    """ The first session open strictly after a moment, now by default; a session already under way does not count """
+    at = _exchange_time(after)
+    day = at.date()
+    while True:
+        hours = session(day)
+        if hours and hours[0] > at:
+            return hours[0]
+        day += timedelta(days=1)
+
+
+def next_close(after: datetime | None = None) -> datetime:
+    """ The first session close strictly after a moment, now by default: today's if the market is open """
+    at = _exchange_time(after)
+    day = at.date()
+    while True:
+        hours = session(day)
+        if hours and hours[1] > at:
+            return hours[1]
+        day += timedelta(days=1)
+
+
+async def acheck_open() -> bool:
+    """
+    Whether the market is open now. With MARKET_CALENDAR_CROSS_CHECK set, Polygon's market status is
+    asked as well and wins if it disagrees; otherwise this is just is_open().
+    """
+    calendar_open = is_open()
+    if not MARKET_CALENDAR_CROSS_CHECK:
+        return calendar_open
+    from market import ais_market_open
+    try:
+        api_open = await ais_market_open()
+    except Exception as e:
+        print(f"Was not able to check the market status with polygon due to {e}; using the calendar")
+        return calendar_open
+    if api_open != calendar_open:
+        print(f"The market calendar says the market is {'open' if calendar_open else 'closed'} but polygon disagrees")
+    return api_open
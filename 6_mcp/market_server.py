@@ -1,5 +1,7 @@
+import json
 from mcp.server.fastmcp import FastMCP
-from market import get_share_price
+from market import aget_share_price, aget_share_prices, price_cache
+from database import stop_on_sigterm
 
 mcp = FastMCP("market_server")
 
@@ -10,7 +12,21 @@ async def lookup_share_price(symbol: str) -> float:
     Args:
         symbol: the symbol of the stock
     """
-    return get_share_price(symbol)
+    return await aget_share_price(symbol)
+
+@mcp.tool()
+async def lookup_share_prices(symbols: list[str]) -> dict[str, float]:
+    """This tool provides the current prices of several stock symbols in one call.
+
+    Args:
+        symbols: the symbols of the stocks
+    """
+    return await aget_share_prices(symbols)
+
+@mcp.resource("market://price_cache")
+async def read_price_cache_stats() -> str:
+    return json.dumps(price_cache.stats())
 
 if __name__ == "__main__":
+    stop_on_sigterm()
     mcp.run(transport='stdio')
\ No newline at end of file
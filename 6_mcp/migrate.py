@@ -0,0 +1,30 @@
+"""
+Convert an accounts.db written by the original JSON-blob schema to the normalized ledger tables.
+
+Opening the database with database.py performs the migration; this script does it in bulk up front
+and reports what was converted.
+
+Usage: uv run migrate.py [path/to/accounts.db]
+"""
+import os
+import sys
+
+if len(sys.argv) > 1:
+    # database loads .env with override=True; keep an ACCOUNTS_DB there from replacing the path given here
+    import dotenv
+    dotenv.load_dotenv = lambda *args, **kwargs: False
+    os.environ["ACCOUNTS_DB"] = sys.argv[1]
+
+import database  # noqa: E402
+
+
+def summary() -> dict[str, int]:
+    conn = database.connect()
+    tables = ["accounts", "holdings", "transactions", "portfolio_snapshots"]
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+
+
+if __name__ == "__main__":
+    print(f"Database: {database.DB}")
+    for table, count in summary().items():
+        print(f"{table:>20}: {count:,} rows")
@@ -0,0 +1,216 @@
+"""
+A local stand-in for the Polygon endpoints this project calls, for load testing without the real API.
+
+It serves previous close, grouped daily aggregates, ticker snapshots (one or many) and market status,
+in Polygon's response shapes, from a FixtureMarket: the closing prices recorded in ACCOUNTS_DB by
+write_market, a JSON file of date to symbol to close, or a synthetic random walk. Snapshots are priced
+at the latest close, optionally moved by a random walk so live prices change between requests.
+
+Latency and failures can be injected: every request waits --latency ms plus up to --jitter ms, and a
+fraction --error-rate of requests fail with --error-status. Counts are served at /stub/stats.
+
+Point the project at it with POLYGON_BASE_URL, and any POLYGON_API_KEY:
+
+    uv run polygon_stub.py --port 8765 --latency 50 --error-rate 0.02
+    POLYGON_BASE_URL=http://127.0.0.1:8765 POLYGON_API_KEY=stub uv run trading_floor.py
+
+Usage: uv run polygon_stub.py [--port 8765] [--fixture closes.json | --history] [--symbols 500] [--days 30]
+    [--latency 0] [--jitter 0] [--error-rate 0] [--error-status 503] [--volatility 0] [--market calendar]
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from fixture_market import FixtureMarket
+from market_calendar import is_open
+
+DEFAULT_PORT = 8765
+# Synthetic markets are priced under these names first, so the EOD probe of SPY and familiar tickers work
+COMMON_SYMBOLS = ["SPY", "AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "BRK.B", "JPM", "V", "UNH"]
+
+
+def _timestamp(date: str) -> int:
+    """ Milliseconds at noon UTC on a date, which is the same date in every time zone the project runs in """
+    return int(datetime.strptime(date, "%Y-%m-%d").replace(hour=12, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class PolygonStub:
+
+    def __init__(self, market: FixtureMarket, port: int = DEFAULT_PORT, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, volatility: float = 0.0, market_status: str = "calendar",
+                 seed: int = 0):
+        """
+        Args:
+            market (FixtureMarket): The closing prices to serve; the latest date is "today"
+            port (int): Where to listen on 127.0.0.1; 0 picks a free port
+            latency (float): Milliseconds every request waits before answering
+            jitter (float): Up to this many further milliseconds, chosen at random per request
+            error_rate (float): The fraction of requests that fail with error_status
+            error_status (int): The HTTP status of an injected failure
+            volatility (float): Standard deviation of the random walk applied to snapshot prices on each request
+            market_status (str): "open", "closed", or "calendar" to follow market_calendar.is_open()
+            seed (int): Seeds the jitter, errors and random walk, so runs are repeatable
+        """
+        self.market = market
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.volatility = volatility
+        self.market_status = market_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.today = market.dates[-1]
+        self.live = dict(market.closes[self.today])
+        self.requests = Counter()
+        self.errors = Counter()
+        self.server: ThreadingHTTPServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1] if self.server else self.port}"
+
+    def start(self) -> str:
+        """ Serve from a background thread; returns the base URL """
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self._handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="polygon-stub").start()
+        return self.base_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    def respond(self, path: str, query: dict[str, list[str]]) -> tuple[int, dict]:
+        """ The status and JSON body for a request, after any injected latency or failure """
+        endpoint, body = self._route(path, query)
+        with self.lock:
+            self.requests[endpoint] += 1
+            delay = (self.latency + self.rng.uniform(0, self.jitter)) / 1000
+            failed = endpoint != "stats" and self.rng.random() < self.error_rate
+            if failed:
+                self.errors[endpoint] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self.error_status, {"status": "ERROR", "error": "Injected by polygon_stub"}
+        if body is None:
+            return 404, {"status": "NOT_FOUND", "message": f"No stub for {path}"}
+        return 200, body
+
+    def _route(self, path: str, query: dict[str, list[str]]) -> tuple[str, dict | None]:
+        parts = path.strip("/").split("/")
+        if path == "/stub/stats":
+            return "stats", self.stats()
+        if path == "/v1/marketstatus/now":
+            return "market_status", self._market_status()
+        if len(parts) == 5 and parts[:3] == ["v2", "aggs", "ticker"] and parts[4] == "prev":
+            return "previous_close", self._previous_close(parts[3])
+        if len(parts) == 8 and parts[:3] == ["v2", "aggs", "grouped"]:
+            return "grouped_daily", self._grouped_daily(parts[7])
+        if len(parts) == 7 and parts[:2] == ["v2", "snapshot"] and parts[6] == "tickers":
+            tickers = query.get("tickers", [""])[0]
+            return "snapshot_all", {"status": "OK", "tickers": self._snapshots(tickers.split(",") if tickers else None)}
+        if len(parts) == 8 and parts[:2] == ["v2", "snapshot"] and parts[6] == "tickers":
+            snapshots = self._snapshots([parts[7]])
+            return "snapshot_ticker", {"status": "OK", "ticker": snapshots[0]} if snapshots else None
+        return "unknown", None
+
+    def _market_status(self) -> dict:
+        market_open = is_open() if self.market_status == "calendar" else self.market_status == "open"
+        return {"market": "open" if market_open else "closed", "serverTime": datetime.now(timezone.utc).isoformat()}
+
+    def _previous_close(self, ticker: str) -> dict:
+        close = self.market.closes[self.today].get(ticker)
+        if close is None:
+            return {"ticker": ticker, "status": "OK", "resultsCount": 0, "results": []}
+        bar = {"T": ticker, "o": close, "h": close, "l": close, "c": close, "v": 0, "t": _timestamp(self.today)}
+        return {"ticker": ticker, "status": "OK", "resultsCount": 1, "results": [bar]}
+
+    def _grouped_daily(self, date: str) -> dict:
+        closes = self.market.closes.get(date, {})
+        t = _timestamp(date)
+        results = [{"T": ticker, "o": close, "h": close, "l": close, "c": close, "v": 0, "t": t} for ticker, close in closes.items()]
+        return {"status": "OK", "resultsCount": len(results), "results": results}
+
+    def _snapshots(self, tickers: list[str] | None) -> list[dict]:
+        with self.lock:
+            if self.volatility:
+                self.live = {ticker: max(0.01, price * (1 + self.rng.gauss(0, self.volatility))) for ticker, price in self.live.items()}
+            live = self.live
+        closes = self.market.closes[self.today]
+        return [
+            {"ticker": ticker, "min": {"c": live[ticker]}, "prevDay": {"c": closes[ticker]}, "day": {"c": live[ticker]}}
+            for ticker in (tickers if tickers is not None else live)
+            if ticker in live
+        ]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = stub.respond(url.path, parse_qs(url.query))
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic market data in place of Polygon")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--fixture", help="a JSON file mapping each date to a dict of symbol to closing price")
+    parser.add_argument("--history", action="store_true", help="serve the closing prices stored in ACCOUNTS_DB")
+    parser.add_argument("--symbols", type=int, default=500, help="symbols in a synthetic market")
+    parser.add_argument("--days", type=int, default=30, help="days in a synthetic market")
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many further milliseconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--volatility", type=float, default=0.0, help="random walk on snapshot prices per request")
+    parser.add_argument("--market", choices=["calendar", "open", "closed"], default="calendar", help="the market status to report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.fixture:
+        market = FixtureMarket.from_json(args.fixture)
+    elif args.history:
+        market = FixtureMarket.from_database()
+    else:
+        market = FixtureMarket.synthetic(args.symbols, args.days, args.seed, names=COMMON_SYMBOLS)
+    stub = PolygonStub(
+        market, args.port, args.latency, args.jitter, args.error_rate, args.error_status,
+        args.volatility, args.market, args.seed,
+    )
+    print(f"Serving {len(market.closes[stub.today])} symbols as of {stub.today} at {stub.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
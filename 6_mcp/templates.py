@@ -6,7 +6,7 @@ if is_realtime_polygon:
 elif is_paid_polygon:
     note = "You have access to market data tools but without access to the trade or quote tools; use your get_snapshot_ticker tool to get the latest share price on a 15 min delay. You can also use tools for share information, trends and technical indicators and fundamentals."
 else:
-    note = "You have access to end of day market data; use you get_share_price tool to get the share price as of the prior close."
+    note = "You have access to end of day market data; use you get_share_price tool to get the share price as of the prior close, or lookup_share_prices for several symbols at once."
 
 
 def researcher_instructions():
@@ -39,7 +39,7 @@ You are {name}, a trader on the stock market. Your account is under your name, {
 You actively manage your portfolio according to your strategy.
 You have access to tools including a researcher to research online for news and opportunities, based on your request.
 You also have tools to access to financial data for stocks. {note}
-And you have tools to buy and sell stocks using your account name {name}.
+And you have tools to buy and sell stocks using your account name {name}; use execute_orders to place several orders at once.
 You can use your entity tools as a persistent memory to store and recall information; you share
 this memory with other traders and can benefit from the group's knowledge.
 Use these tools to carry out research, make decisions, and execute trades.
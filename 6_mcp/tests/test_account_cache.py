@@ -0,0 +1,41 @@
+import os
+import sys
+import signal
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+
+SCRIPT = """
+import asyncio, os, signal
+from database import stop_on_sigterm
+from account_cache import account_cache
+
+async def main():
+    async with account_cache.account("alice") as account:
+        await account.areport()
+        assert account.dirty
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.sleep(30)
+
+stop_on_sigterm()
+asyncio.run(main())
+"""
+
+
+class AccountCacheTest(unittest.TestCase):
+
+    def test_held_changes_are_saved_when_stopped_with_sigterm(self):
+        path = os.path.join(tempfile.mkdtemp(), "cache.db")
+        env = {**os.environ, "ACCOUNTS_DB": path, "ACCOUNT_CACHE_FLUSH_SECONDS": "60", "POLYGON_API_KEY": ""}
+        result = subprocess.run(
+            [sys.executable, "-c", SCRIPT], env=env, timeout=60,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        self.assertEqual(result.returncode, 128 + signal.SIGTERM)
+        with sqlite3.connect(path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM portfolio_snapshots WHERE name = 'alice'").fetchone()[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import json
+import tempfile
+import unittest
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import ClassVar
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(), "accounts.db"))
+
+import database  # noqa: E402
+from codec import decode  # noqa: E402
+from ledger import replay  # noqa: E402
+from accounts import Account  # noqa: E402
+
+PRICE = 10.0
+PROCESSES = 6
+BUYS = 30
+
+
+class FixedPriceAccount(Account):
+
+    def _share_price(self, symbol: str) -> float:
+        return PRICE
+
+    def _share_prices(self, symbols) -> dict[str, float]:
+        return {symbol: PRICE for symbol in symbols}
+
+    def _log(self, message: str):
+        pass
+
+
+def _buy(path: str, name: str, start, buys: int) -> int:
+    """ Buy one share at a time from a process of its own; returns how many buys succeeded """
+    database.use_database(path)
+    account = FixedPriceAccount.get(name)
+    start.wait()
+    completed = 0
+    for _ in range(buys):
+        account.buy_shares("AAPL", 1, "contention")
+        completed += 1
+    return completed
+
+
+class ConcurrentTradesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        self.path = os.path.join(tempfile.mkdtemp(), "contention.db")
+        database.use_database(self.path)
+        FixedPriceAccount.get("contended")
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    def test_every_trade_from_every_process_is_saved_once(self):
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager:
+            start = manager.Barrier(PROCESSES)
+            with context.Pool(PROCESSES) as pool:
+                completed = pool.starmap(_buy, [(self.path, "contended", start, BUYS)] * PROCESSES)
+        self.assertEqual(completed, [BUYS] * PROCESSES)
+        account = FixedPriceAccount.get("contended")
+        self.assertEqual(len(account.transactions), PROCESSES * BUYS)
+        self.assertEqual(account.holdings, {"AAPL": PROCESSES * BUYS})
+        self.assertEqual(len(database.read_portfolio_snapshots("contended")), PROCESSES * BUYS)
+
+
+class FullReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        database.use_database(os.path.join(tempfile.mkdtemp(), "report.db"))
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    def test_full_view_includes_history_that_was_not_loaded(self):
+        account = FixedPriceAccount.get("reporter")
+        account.buy_shares("AAPL", 1, "first")
+        account.report()
+        fresh = FixedPriceAccount.get("reporter", transactions=False)
+        full = json.loads(fresh.report("full"))
+        self.assertEqual(len(full["portfolio_value_time_series"]), 3)
+        self.assertEqual(len(database.read_portfolio_snapshots("reporter")), 3)
+        self.assertEqual([t["rationale"] for t in full["transactions"]], ["first"])
+
+
+OPENED = datetime(2025, 1, 2, 9, 0)
+
+
+class ClockedAccount(FixedPriceAccount):
+    """ Stamps each change a minute after the one before, so every event has a time of its own """
+    minutes: ClassVar[int] = 0
+
+    def _now(self) -> str:
+        ClockedAccount.minutes += 1
+        return (OPENED + timedelta(minutes=ClockedAccount.minutes)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class LedgerReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        database.use_database(os.path.join(tempfile.mkdtemp(), "ledger.db"))
+        ClockedAccount.minutes = 0
+        database.create_account("replayed", 10_000.0, timestamp=OPENED.strftime("%Y-%m-%d %H:%M:%S"))
+        self.account = ClockedAccount.get("replayed")
+        # (timestamp, state) after each trade, across more than two snapshot intervals
+        self.states = []
+        for i in range(2 * database.ACCOUNT_SNAPSHOT_EVERY + 10):
+            if i % 3 == 2:
+                self.account.sell_shares("AAPL", 1, f"trade {i}")
+            else:
+                self.account.buy_shares("AAPL" if i % 2 else "MSFT", 2, f"trade {i}")
+            self.states.append((self.account.transactions[-1].timestamp, self._state(self.account)))
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    @staticmethod
+    def _state(account: Account) -> dict:
+        return {
+            "balance": account.balance,
+            "holdings": dict(account.holdings),
+            "net_invested": account.net_invested,
+            "cost_basis": dict(account.cost_basis),
+            "realized_pnl": account.realized_pnl,
+        }
+
+    def test_get_replays_from_the_newest_snapshot(self):
+        conn = database.connect()
+        snapshot = conn.execute("SELECT COUNT(*), MAX(event_id) FROM account_snapshots WHERE name = 'replayed'").fetchone()
+        since = conn.execute("SELECT COUNT(*) FROM account_events WHERE name = 'replayed' AND id > ?", (snapshot[1],)).fetchone()[0]
+        self.assertGreaterEqual(snapshot[0], 3)
+        self.assertGreater(since, 0)
+        events = conn.execute("SELECT type, format, data FROM account_events WHERE name = 'replayed' ORDER BY id").fetchall()
+        from_scratch = replay({}, ((type, decode(format, data)) for type, format, data in events))
+        loaded = self._state(ClockedAccount.get("replayed"))
+        self.assertEqual(loaded, self._state(self.account))
+        self.assertEqual(loaded, {key: from_scratch[key] for key in loaded})
+
+    def test_as_of_matches_the_account_after_each_trade(self):
+        for i, (timestamp, state) in enumerate(self.states):
+            then = ClockedAccount.as_of("replayed", timestamp)
+            self.assertEqual(self._state(then), state, timestamp)
+            self.assertEqual(len(then.transactions), i + 1)
+
+    def test_as_of_before_the_account_was_opened(self):
+        self.assertIsNone(ClockedAccount.as_of("replayed", "2025-01-01 00:00:00"))
+        opened = ClockedAccount.as_of("replayed", OPENED.strftime("%Y-%m-%d %H:%M:%S"))
+        self.assertEqual((opened.balance, opened.holdings, len(opened.transactions)), (10_000.0, {}, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
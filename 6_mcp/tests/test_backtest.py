@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(), "accounts.db"))
+
+import database  # noqa: E402
+from backtest import Backtest, random_strategy  # noqa: E402
+from fixture_market import FixtureMarket  # noqa: E402
+
+
+class BacktestTest(unittest.TestCase):
+
+    def test_runs_in_memory_without_touching_the_database(self):
+        previous = database.DB
+        result = Backtest(FixtureMarket.synthetic(10, 20), random_strategy(10), ["alice", "bob"]).run()
+        self.assertEqual(database.DB, previous)
+        self.assertIsNone(database.read_account("alice"))
+        self.assertGreater(result["trades"], 0)
+        self.assertEqual(set(result["accounts"]), {"alice", "bob"})
+
+    def test_results_are_repeatable(self):
+        market = FixtureMarket.synthetic(10, 20)
+        first = Backtest(market, random_strategy(10, seed=3), ["alice"]).run()
+        second = Backtest(market, random_strategy(10, seed=3), ["alice"]).run()
+        self.assertEqual(first["accounts"], second["accounts"])
+
+
+if __name__ == "__main__":
+    unittest.main()
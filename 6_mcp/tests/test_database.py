@@ -0,0 +1,87 @@
+import os
+import sys
+import signal
+import subprocess
+import json
+import sqlite3
+import tempfile
+import unittest
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(), "accounts.db"))
+
+import database  # noqa: E402
+
+
+class MigrateLegacyMarketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        self.path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    def test_null_closes_are_skipped(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE market (date TEXT PRIMARY KEY, data TEXT)")
+            conn.execute("INSERT INTO market VALUES (?, ?)", ("2025-01-02", json.dumps({"AAPL": 190.5, "DELISTED": None})))
+        database.use_database(self.path)
+        self.assertEqual(database.read_market("2025-01-02"), {"AAPL": 190.5})
+        self.assertIsNone(database.connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market'"
+        ).fetchone())
+
+
+class ReadPositionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        self.path = os.path.join(tempfile.mkdtemp(), "positions.db")
+        database.use_database(self.path)
+        database.create_account("alice", 1000.0)
+        database.create_account("bob", 1000.0)
+        version = database.read_account_version("alice")
+        database.save_account(
+            "alice", 800.0, "", {"AAPL": 2}, [
+                {"symbol": "AAPL", "quantity": 3, "price": 100.0, "timestamp": "2025-01-02 10:00:00", "rationale": ""},
+                {"symbol": "AAPL", "quantity": -1, "price": 90.0, "timestamp": "2025-01-02 11:00:00", "rationale": ""},
+            ], [], version=version, events=[
+                ("buy", {"symbol": "AAPL", "quantity": 3, "price": 100.0}, "2025-01-02 10:00:00"),
+                ("sell", {"symbol": "AAPL", "quantity": 1, "price": 90.0}, "2025-01-02 11:00:00"),
+            ], aggregates={"net_invested": 210.0, "cost_basis": {"AAPL": 100.0}, "realized_pnl": -10.0},
+        )
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    def test_net_invested_comes_from_the_account_row(self):
+        accounts, holdings = database.read_positions()
+        self.assertEqual(accounts, [("alice", 800.0, 210.0), ("bob", 1000.0, 0.0)])
+        self.assertEqual(holdings, [("alice", "AAPL", 2)])
+        self.assertEqual(database.read_positions(["Bob"]), ([("bob", 1000.0, 0.0)], []))
+
+    def test_column_is_backfilled_from_the_ledger(self):
+        database.connect().execute("ALTER TABLE accounts DROP COLUMN net_invested")
+        database.use_database(self.path)
+        self.assertEqual(database.read_positions(["alice"])[0], [("alice", 800.0, 210.0)])
+
+
+class StopOnSigtermTest(unittest.TestCase):
+
+    def test_pending_log_entries_are_written(self):
+        path = os.path.join(tempfile.mkdtemp(), "sigterm.db")
+        script = (
+            "import os, signal, time, database\n"
+            "database.stop_on_sigterm()\n"
+            "database.write_log('alice', 'account', 'Bought 1 of AAPL')\n"
+            "os.kill(os.getpid(), signal.SIGTERM)\n"
+            "time.sleep(5)\n"
+        )
+        env = {**os.environ, "ACCOUNTS_DB": path, "LOG_FLUSH_SECONDS": "60"}
+        result = subprocess.run([sys.executable, "-c", script], env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=30)
+        self.assertEqual(result.returncode, 128 + signal.SIGTERM)
+        with sqlite3.connect(path) as conn:
+            self.assertEqual(conn.execute("SELECT message FROM logs").fetchall(), [("Bought 1 of AAPL",)])
+
+if __name__ == "__main__":
+    unittest.main()
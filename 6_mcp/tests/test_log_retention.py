@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(), "accounts.db"))
+
+import database  # noqa: E402
+from log_retention import _runs, compact_logs  # noqa: E402
+
+# id, type, message: two entries from before any run, then runs starting at ids 3, 7 and 10
+LOGS = [
+    (1, "agent", "Loading"),
+    (2, "function", "lookup"),
+    (3, "trace", "Started: run A"),
+    (4, "agent", "Thinking"),
+    (5, "function", "buy_shares"),
+    (6, "trace", "Ended: run A"),
+    (7, "trace", "Started: run B"),
+    (8, "agent", "Thinking"),
+    (9, "trace", "Ended: run B"),
+    (10, "trace", "Started: run C"),
+    (11, "agent", "Thinking"),
+]
+
+
+class RunsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        database.use_database(os.path.join(tempfile.mkdtemp(), "logs.db"))
+        with database.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO logs (id, name, datetime, type, message) VALUES (?, 'warren', ?, ?, ?)",
+                [(id, f"2025-01-02 10:{id:02d}:00", type, message) for id, type, message in LOGS],
+            )
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    def test_cutoff_at_the_end_of_a_run(self):
+        self.assertEqual(_runs("warren", 9), [(1, 2, "Entries before first run"), (3, 6, "run A"), (7, 9, "run B")])
+
+    def test_a_run_in_progress_at_the_cutoff_is_left_alone(self):
+        self.assertEqual(_runs("warren", 8), [(1, 2, "Entries before first run"), (3, 6, "run A")])
+        self.assertEqual(_runs("warren", 3), [(1, 2, "Entries before first run")])
+
+    def test_nothing_before_the_cutoff(self):
+        self.assertEqual(_runs("warren", 0), [])
+        self.assertEqual(_runs("nobody", 9), [])
+
+    def test_compact_logs_replaces_each_run_with_a_summary(self):
+        result = compact_logs(max_age_days=365_000, max_rows=2)
+        self.assertEqual((result["deleted"], result["summaries"]), (9, 3))
+        rows = database.connect().execute("SELECT id, type, message FROM logs WHERE name = 'warren' ORDER BY id").fetchall()
+        self.assertEqual(rows, [
+            (1, "summary", "Entries before first run: 1 agent, 1 function"),
+            (3, "summary", "run A: 1 agent, 1 function, 2 trace"),
+            (7, "summary", "run B: 1 agent, 2 trace"),
+            (10, "trace", "Started: run C"),
+            (11, "agent", "Thinking"),
+        ])
+        self.assertEqual(_runs("warren", 9), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
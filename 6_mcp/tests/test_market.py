@@ -0,0 +1,44 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(), "accounts.db"))
+
+from market import PriceCache  # noqa: E402
+
+
+class PriceCacheTest(unittest.TestCase):
+
+    def test_cancelled_fetch_releases_waiters(self):
+        async def afetch(symbols):
+            await asyncio.sleep(10)
+
+        cache = PriceCache(lambda symbols: {symbol: 1.0 for symbol in symbols}, afetch, wait=1.0)
+
+        async def run():
+            owner = asyncio.create_task(cache.aget("AAPL"))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.create_task(cache.aget("AAPL"))
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await owner
+            with self.assertRaises(RuntimeError):
+                await waiter
+
+        asyncio.run(run())
+        self.assertEqual(cache.in_flight, {})
+
+    def test_wait_on_another_fetch_times_out(self):
+        cache = PriceCache(lambda symbols: {symbol: 1.0 for symbol in symbols}, wait=0.05)
+        cache.in_flight["AAPL"] = Future()
+        with self.assertRaises(TimeoutError):
+            cache.get("AAPL")
+        with self.assertRaises(TimeoutError):
+            asyncio.run(cache.aget("AAPL"))
+
+
+if __name__ == "__main__":
+    unittest.main()
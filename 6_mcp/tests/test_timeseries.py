@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(), "accounts.db"))
+
+import database  # noqa: E402
+from timeseries import DATETIME_FORMAT, lttb, _tiers, read_portfolio_series  # noqa: E402
+
+NOW = datetime(2025, 6, 2, 12, 0)
+
+
+def _series(count: int, start: datetime = NOW, step: timedelta = timedelta(minutes=1)) -> list[tuple[str, float]]:
+    return [((start + i * step).strftime(DATETIME_FORMAT), 100.0 + i % 7) for i in range(count)]
+
+
+class LttbTest(unittest.TestCase):
+
+    def test_short_series_are_returned_whole(self):
+        points = _series(10)
+        self.assertEqual(lttb(points, 10), points)
+        self.assertEqual(lttb(points, 50), points)
+        self.assertEqual(lttb(points, 2), points)
+
+    def test_downsamples_to_the_threshold_keeping_the_ends(self):
+        points = _series(1000)
+        sampled = lttb(points, 50)
+        self.assertEqual(len(sampled), 50)
+        self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+        self.assertTrue(set(sampled) <= set(points))
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_keeps_a_spike(self):
+        points = [(dt, 100.0) for dt, _ in _series(500)]
+        points[237] = (points[237][0], 500.0)
+        self.assertIn(points[237], lttb(points, 20))
+
+
+class TierTest(unittest.TestCase):
+
+    def _start(self, days: float) -> str:
+        return (NOW - timedelta(days=days)).strftime(DATETIME_FORMAT)
+
+    def test_recent_ranges_can_use_every_tier(self):
+        self.assertEqual(_tiers(self._start(1), NOW), [None, 300, 3600, 86400])
+
+    def test_older_ranges_skip_tiers_that_have_been_pruned(self):
+        self.assertEqual(_tiers(self._start(7), NOW), [300, 3600, 86400])
+        self.assertEqual(_tiers(self._start(30), NOW), [3600, 86400])
+        self.assertEqual(_tiers(self._start(365), NOW), [86400])
+
+
+class ReadPortfolioSeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = database.DB
+        database.use_database(os.path.join(tempfile.mkdtemp(), "series.db"))
+        database.create_account("charted", 10_000.0)
+        self.start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=12)
+
+    def tearDown(self):
+        database.use_database(self.previous)
+
+    def test_reads_the_raw_series_while_it_is_small_enough(self):
+        points = _series(300, self.start)
+        database.append_portfolio_snapshots("charted", points)
+        self.assertEqual(read_portfolio_series("charted", max_points=300), points)
+
+    def test_falls_back_to_the_finest_rollup_that_fits(self):
+        database.append_portfolio_snapshots("charted", _series(600, self.start))
+        series = read_portfolio_series("charted", start=self.start.strftime(DATETIME_FORMAT), max_points=20)
+        self.assertEqual(len(series), 20)
+        five_minute = database.read_portfolio_rollups("charted", 300)
+        self.assertEqual(len(five_minute), 120)
+        self.assertTrue(set(series) <= set(five_minute))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from transaction_log import TransactionLog
+
+RECORDS = [
+    {"symbol": "AAPL", "quantity": 10, "price": 190.25, "timestamp": "2024-01-02 09:30:00", "rationale": "Opening position"},
+    {"symbol": "MSFT", "quantity": 5, "price": 370.0, "timestamp": "2024-01-02 10:15:42", "rationale": ""},
+    {"symbol": "AAPL", "quantity": -4, "price": 195.5, "timestamp": "2024-01-03 15:59:59", "rationale": "Trim"},
+]
+
+
+class TransactionLogTest(unittest.TestCase):
+
+    def test_records_round_trip(self):
+        log = TransactionLog(RECORDS)
+        self.assertEqual(log.records(), RECORDS)
+        self.assertEqual(log.records(2), RECORDS[2:])
+        self.assertEqual([t.model_dump() for t in log], RECORDS)
+        self.assertEqual(log[-1].model_dump(), RECORDS[-1])
+        self.assertEqual(log.symbols, ["AAPL", "MSFT"])
+
+    def test_other_timestamp_formats_are_kept_verbatim(self):
+        timestamps = [
+            "2024-01-01T09:30:00",
+            "2024/01/01 09:30:00",
+            "2024-01-01 09-30-00",
+            "2024-01-01 09:30:00.123",
+            "0999-01-01 09:30:00",
+            "2024-01-01 ０9:30:00",
+            "yesterday",
+        ]
+        log = TransactionLog([{**RECORDS[0], "timestamp": timestamp} for timestamp in timestamps])
+        self.assertEqual([record["timestamp"] for record in log.records()], timestamps)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Tiered storage and downsampled queries for each account's portfolio value over time.
+
+Raw values are kept for PORTFOLIO_RAW_DAYS; 5 minute, hourly and daily averages are maintained as
+values are written (see database.save_account) and kept for progressively longer. Queries pick the
+finest tier that still covers the requested range and reduce it to at most max_points with
+largest-triangle-three-buckets, so chart payloads stay the same size however long a trader runs.
+"""
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import (
+    ROLLUP_RESOLUTIONS,
+    read_portfolio_snapshots,
+    read_portfolio_rollups,
+    count_portfolio_points,
+    first_portfolio_datetime,
+    prune_portfolio_series,
+)
+
+load_dotenv(override=True)
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+PORTFOLIO_RAW_DAYS = float(os.getenv("PORTFOLIO_RAW_DAYS", "2"))
+
+# How long each rollup tier is kept, in days; None keeps it forever
+ROLLUP_RETENTION_DAYS = {300: 14, 3600: 180, 86400: None}
+
+DEFAULT_MAX_POINTS = 200
+
+# A tier is read if it holds no more than this many times the requested points; LTTB does the rest
+OVERSAMPLE = 8
+
+
+def _timestamp(value: str) -> float:
+    return datetime.strptime(value, DATETIME_FORMAT).timestamp()
+
+
+def lttb(points: list[tuple[str, float]], threshold: int) -> list[tuple[str, float]]:
+    """
+    Downsample a series with largest-triangle-three-buckets, keeping the first and last points
+    and, from each bucket in between, the point that forms the largest triangle with its neighbours.
+
+    Args:
+        points (list): (datetime, value) pairs, oldest first
+        threshold (int): The maximum number of points to return
+
+    Returns:
+        list: At most threshold of the original points
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    xs = [_timestamp(dt) for dt, _ in points]
+    ys = [value for _, value in points]
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_xs, next_ys = xs[end:next_end] or xs[-1:], ys[end:next_end] or ys[-1:]
+        avg_x = sum(next_xs) / len(next_xs)
+        avg_y = sum(next_ys) / len(next_ys)
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def _tiers(start: str, now: datetime) -> list[int | None]:
+    """ The tiers, finest first, whose retention still reaches back to start; None is the raw series """
+    tiers = []
+    if start >= (now - timedelta(days=PORTFOLIO_RAW_DAYS)).strftime(DATETIME_FORMAT):
+        tiers.append(None)
+    for resolution in ROLLUP_RESOLUTIONS:
+        days = ROLLUP_RETENTION_DAYS[resolution]
+        if days is None or start >= (now - timedelta(days=days)).strftime(DATETIME_FORMAT):
+            tiers.append(resolution)
+    return tiers or [ROLLUP_RESOLUTIONS[-1]]
+
+
+def read_portfolio_series(name: str, start: str = "", end: str = "9999", max_points: int = DEFAULT_MAX_POINTS) -> list[tuple[str, float]]:
+    """
+    Read an account's portfolio value over a time range, downsampled to at most max_points.
+
+    Args:
+        name (str): The account name
+        start (str): Earliest datetime to include, as YYYY-MM-DD HH:MM:SS; empty for the beginning
+        end (str): Latest datetime to include
+        max_points (int): The maximum number of points to return
+
+    Returns:
+        list: (datetime, value) pairs, oldest first
+    """
+    start = start or first_portfolio_datetime(name) or ""
+    tiers = _tiers(start, datetime.now())
+    chosen = tiers[-1]
+    for tier in tiers:
+        count = count_portfolio_points(name, tier, start, end)
+        if count and count <= max_points * OVERSAMPLE:
+            chosen = tier
+            break
+    if chosen is None:
+        points = read_portfolio_snapshots(name, start, end)
+    else:
+        points = read_portfolio_rollups(name, chosen, start, end)
+    return lttb(points, max_points)
+
+
+def prune_series(now: datetime | None = None) -> int:
+    """ Drop raw values and rollup buckets that have aged out of their tier. Returns the rows deleted. """
+    now = now or datetime.now()
+    raw_before = (now - timedelta(days=PORTFOLIO_RAW_DAYS)).strftime(DATETIME_FORMAT)
+    rollups_before = {
+        resolution: (now - timedelta(days=days)).strftime(DATETIME_FORMAT)
+        for resolution, days in ROLLUP_RETENTION_DAYS.items()
+        if days is not None
+    }
+    return prune_portfolio_series(raw_before, rollups_before)
@@ -3,8 +3,12 @@ from typing import List
 import asyncio
 from tracers import LogTracer
 from agents import add_trace_processor
-from market import is_market_open
+from market_calendar import acheck_open, next_open
+from log_retention import compact_logs
+from timeseries import prune_series
+from database import stop_on_sigterm
 from dotenv import load_dotenv
+from datetime import datetime
 import os
 
 load_dotenv(override=True)
@@ -34,12 +38,17 @@ async def run_every_n_minutes():
     add_trace_processor(LogTracer())
     traders = create_traders()
     while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
+        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or await acheck_open():
             await asyncio.gather(*[trader.run() for trader in traders])
+            await asyncio.to_thread(compact_logs)
+            await asyncio.to_thread(prune_series)
+            await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
         else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+            opens = next_open()
+            print(f"Market is closed, sleeping until it opens at {opens:%Y-%m-%d %H:%M %Z}")
+            await asyncio.sleep(max(0.0, (opens - datetime.now(opens.tzinfo)).total_seconds()))
 
 if __name__ == "__main__":
+    stop_on_sigterm()
     print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
     asyncio.run(run_every_n_minutes())
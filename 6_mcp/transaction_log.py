@@ -0,0 +1,140 @@
+"""
+Compact, column-oriented storage for an account's transactions.
+
+Each column is a typed array: symbols are interned to small ids, timestamps are packed into integers
+(YYYYMMDDHHMMSS) and rationales are kept in a separate list. Loading an account fills the columns
+straight from the database rows without building a model per transaction, and saving reads them back
+out the same way. Transaction objects are only built when a caller indexes or iterates the log.
+
+As a pydantic field a TransactionLog accepts a list of Transaction objects or dicts, and serializes
+back to a list of dicts, so model_dump() and the JSON reports are unchanged.
+"""
+from array import array
+from collections.abc import Sequence
+from pydantic_core import core_schema
+
+TIMESTAMP_LENGTH = len("YYYY-MM-DD HH:MM:SS")
+
+
+def _pack_timestamp(timestamp: str) -> int:
+    """
+    YYYY-MM-DD HH:MM:SS as the integer YYYYMMDDHHMMSS, or -1 if it is in some other format.
+    Only a timestamp that _unpack_timestamp gives back exactly is packed: every separator is checked, the
+    digits must be ASCII, and the year must not start with 0, which the integer would drop.
+    """
+    if (
+        len(timestamp) != TIMESTAMP_LENGTH
+        or timestamp[4] != "-" or timestamp[7] != "-" or timestamp[10] != " "
+        or timestamp[13] != ":" or timestamp[16] != ":" or timestamp[0] == "0"
+    ):
+        return -1
+    digits = timestamp[0:4] + timestamp[5:7] + timestamp[8:10] + timestamp[11:13] + timestamp[14:16] + timestamp[17:19]
+    return int(digits) if digits.isascii() and digits.isdigit() else -1
+
+
+def _unpack_timestamp(packed: int) -> str:
+    s = str(packed)
+    return f"{s[0:4]}-{s[4:6]}-{s[6:8]} {s[8:10]}:{s[10:12]}:{s[12:14]}"
+
+
+class TransactionLog(Sequence):
+
+    def __init__(self, records=()):
+        self.symbols: list[str] = []
+        self._symbol_ids: dict[str, int] = {}
+        self.symbol_ids = array("I")
+        self.quantities = array("q")
+        self.prices = array("d")
+        self.timestamps = array("q")
+        self.rationales: list[str] = []
+        # Timestamps that are not in the usual format are kept verbatim, by row
+        self._odd_timestamps: dict[int, str] = {}
+        self.extend(records)
+
+    def _symbol_id(self, symbol: str) -> int:
+        id = self._symbol_ids.get(symbol)
+        if id is None:
+            id = self._symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return id
+
+    def add(self, symbol: str, quantity: int, price: float, timestamp: str, rationale: str):
+        packed = _pack_timestamp(timestamp)
+        if packed < 0:
+            self._odd_timestamps[len(self.quantities)] = timestamp
+        self.symbol_ids.append(self._symbol_id(symbol))
+        self.quantities.append(quantity)
+        self.prices.append(price)
+        self.timestamps.append(max(packed, 0))
+        self.rationales.append(rationale)
+
+    def append(self, transaction):
+        """ Add a Transaction, or a dict with the same fields """
+        self.extend((transaction,))
+
+    def extend(self, transactions):
+        add = self.add
+        for t in transactions:
+            if isinstance(t, dict):
+                add(t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+            else:
+                add(t.symbol, t.quantity, t.price, t.timestamp, t.rationale)
+
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+    def _timestamp(self, i: int) -> str:
+        return self._odd_timestamps.get(i) or _unpack_timestamp(self.timestamps[i])
+
+    def record(self, i: int) -> dict:
+        """ Row i as a dict, in the same shape as Transaction.model_dump() """
+        return {
+            "symbol": self.symbols[self.symbol_ids[i]],
+            "quantity": self.quantities[i],
+            "price": self.prices[i],
+            "timestamp": self._timestamp(i),
+            "rationale": self.rationales[i],
+        }
+
+    def records(self, start: int = 0) -> list[dict]:
+        """ Rows from start onwards as dicts, without building Transaction objects """
+        return [self.record(i) for i in range(start, len(self))]
+
+    def __getitem__(self, index):
+        from accounts import Transaction
+        if isinstance(index, slice):
+            return [Transaction(**self.record(i)) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        return Transaction(**self.record(index))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TransactionLog):
+            return self.records() == other.records()
+        if isinstance(other, list):
+            return self.records() == [item if isinstance(item, dict) else item.model_dump() for item in other]
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TransactionLog({len(self)} transactions)"
+
+    @classmethod
+    def _validate(cls, value):
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(value)
+        raise ValueError("transactions must be a list of transactions")
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda log: log.records()),
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "array", "items": {"type": "object"}}
@@ -0,0 +1,146 @@
+"""
+Values many accounts at once.
+
+Positions are held as a matrix of accounts by symbols and prices as a vector, so every account's
+portfolio value is one matrix-vector product. Changes are applied incrementally: a new price moves
+every account's value by its holding times the price change, and a new position moves only that
+account's value, so a refresh costs in proportion to what changed rather than to the number of
+accounts. Rows and columns are allocated with spare capacity, so adding accounts or symbols is cheap.
+"""
+import numpy as np
+from database import read_positions
+from market import get_share_prices
+
+
+class Valuation:
+
+    def __init__(self, capacity: tuple[int, int] = (16, 64)):
+        self.accounts: list[str] = []
+        self.symbols: list[str] = []
+        self._account_index: dict[str, int] = {}
+        self._symbol_index: dict[str, int] = {}
+        rows, columns = capacity
+        self._holdings = np.zeros((rows, columns))
+        self._prices = np.zeros(columns)
+        self._balances = np.zeros(rows)
+        self._net_invested = np.zeros(rows)
+        # Market value of each account's positions, kept up to date as prices and positions change
+        self._position_values = np.zeros(rows)
+
+    @classmethod
+    def load(cls, names: list[str] | None = None) -> "Valuation":
+        """
+        Build a valuation of stored accounts, priced with one bulk price fetch.
+
+        Args:
+            names (list): The accounts to include; all of them if None
+        """
+        accounts, holdings = read_positions(names)
+        valuation = cls(capacity=(max(len(accounts), 16), max(len({symbol for _, symbol, _ in holdings}), 64)))
+        for name, balance, net_invested in accounts:
+            valuation._row(name)
+            valuation.set_balance(name, balance, net_invested)
+        for name, symbol, quantity in holdings:
+            i, j = valuation._row(name), valuation._column(symbol)
+            valuation._holdings[i, j] = quantity
+        valuation.set_prices(get_share_prices(valuation.symbols))
+        valuation.recompute()
+        return valuation
+
+    def _row(self, name: str) -> int:
+        i = self._account_index.get(name)
+        if i is not None:
+            return i
+        i = self._account_index[name] = len(self.accounts)
+        self.accounts.append(name)
+        if i == self._holdings.shape[0]:
+            grow = self._holdings.shape[0]
+            self._holdings = np.vstack([self._holdings, np.zeros((grow, self._holdings.shape[1]))])
+            self._balances = np.concatenate([self._balances, np.zeros(grow)])
+            self._net_invested = np.concatenate([self._net_invested, np.zeros(grow)])
+            self._position_values = np.concatenate([self._position_values, np.zeros(grow)])
+        return i
+
+    def _column(self, symbol: str) -> int:
+        j = self._symbol_index.get(symbol)
+        if j is not None:
+            return j
+        j = self._symbol_index[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        if j == self._holdings.shape[1]:
+            grow = self._holdings.shape[1]
+            self._holdings = np.hstack([self._holdings, np.zeros((self._holdings.shape[0], grow))])
+            self._prices = np.concatenate([self._prices, np.zeros(grow)])
+        return j
+
+    def set_balance(self, name: str, balance: float, net_invested: float | None = None):
+        i = self._row(name)
+        self._balances[i] = balance
+        if net_invested is not None:
+            self._net_invested[i] = net_invested
+
+    def set_position(self, name: str, symbol: str, quantity: float):
+        """ Change one holding; only that account's value is updated. """
+        i, j = self._row(name), self._column(symbol)
+        self._position_values[i] += (quantity - self._holdings[i, j]) * self._prices[j]
+        self._holdings[i, j] = quantity
+
+    def set_account(self, name: str, balance: float, holdings: dict[str, int], net_invested: float | None = None):
+        """ Replace an account's balance and every holding, for instance after reloading it. """
+        i = self._row(name)
+        self._holdings[i, :] = 0.0
+        for symbol, quantity in holdings.items():
+            j = self._column(symbol)
+            self._holdings[i, j] = quantity
+        self.set_balance(name, balance, net_invested)
+        self._position_values[i] = self._holdings[i, :len(self.symbols)] @ self._prices[:len(self.symbols)]
+
+    def set_prices(self, prices: dict[str, float]):
+        """ Apply new prices; every account's value moves by its holding times the change in price. """
+        if not prices:
+            return
+        columns = np.fromiter((self._column(symbol) for symbol in prices), dtype=np.intp, count=len(prices))
+        new = np.fromiter(prices.values(), dtype=float, count=len(prices))
+        n = len(self.accounts)
+        self._position_values[:n] += self._holdings[:n, columns] @ (new - self._prices[columns])
+        self._prices[columns] = new
+
+    def recompute(self):
+        """ Recalculate every value from scratch, clearing any rounding built up by incremental updates. """
+        n, m = len(self.accounts), len(self.symbols)
+        self._position_values[:n] = self._holdings[:n, :m] @ self._prices[:m]
+
+    def values(self) -> np.ndarray:
+        """ Every account's portfolio value, cash included, in the order of self.accounts """
+        n = len(self.accounts)
+        return self._balances[:n] + self._position_values[:n]
+
+    def profit_loss(self) -> np.ndarray:
+        """ Every account's profit or loss, in the order of self.accounts, as Account.calculate_profit_loss """
+        n = len(self.accounts)
+        return self._position_values[:n] - self._net_invested[:n]
+
+    def exposure(self) -> np.ndarray:
+        """ The market value of every position, as a matrix of accounts by symbols """
+        n, m = len(self.accounts), len(self.symbols)
+        return self._holdings[:n, :m] * self._prices[:m]
+
+    def value(self, name: str) -> float:
+        i = self._account_index[name]
+        return float(self._balances[i] + self._position_values[i])
+
+    def account_profit_loss(self, name: str) -> float:
+        i = self._account_index[name]
+        return float(self._position_values[i] - self._net_invested[i])
+
+    def account_exposure(self, name: str) -> dict[str, float]:
+        """ The market value of each of an account's positions """
+        i, m = self._account_index[name], len(self.symbols)
+        row = self._holdings[i, :m] * self._prices[:m]
+        return {self.symbols[j]: float(row[j]) for j in np.flatnonzero(row)}
+
+    def leaderboard(self, top: int | None = None) -> list[tuple[str, float, float]]:
+        """ (name, value, profit or loss) for the accounts with the highest value, best first """
+        values, pnl = self.values(), self.profit_loss()
+        order = np.argsort(-values)[:top]
+        return [(self.accounts[i], float(values[i]), float(pnl[i])) for i in order]